@@ -0,0 +1,8 @@
+# Streamlit entry point serving every inquiry stage from one process
+# 사용법: streamlit run inq_app.py  →  설계 단계: /?stage=design, 분석 단계: /?stage=analysis
+import streamlit as st
+
+from inq_engine import run
+from inq_stages import DEFAULT_STAGE
+
+run(st.query_params.get("stage", DEFAULT_STAGE))
@@ -0,0 +1,311 @@
+# Offline batch job: page_4 summary and rubric scoring for every stored session
+#
+# 사용법: python inq_batch.py [--class 103] [--since 2024-03-01] [--until 2024-07-31] [--stage design] [--workers 8] [--mock]
+#   - 결과는 세션·작업(summary, rubric)마다 inq_batch_results에 한 행씩, 응답이 오는 대로 바로 기록됩니다.
+#     대화·프롬프트·모델로 만든 내용 해시가 같은 결과가 이미 있으면 다시 요청하지 않으므로,
+#     중단 후 다시 실행하면 남은 세션만 처리하고, 프롬프트를 바꾼 뒤 실행하면 예전 결과만 다시 만듭니다.
+#   - --batch-file batch_input.jsonl 은 요청하지 않고 OpenAI Batch API 입력 파일만 작성합니다.
+#     완료된 결과 파일은 --import-results batch_output.jsonl 로 DB에 기록합니다.
+#   - --mock 은 inq_loadtest의 모의 OpenAI 서버를 띄워 외부 네트워크 없이 실행합니다.
+#   - 레거시 저장 방식이면 먼저 새로 저장된 qna 행을 교사용 앱의 검색 색인(inq_qna_search)에 반영합니다.
+#     교사용 앱이 실행 중이면 백그라운드에서 계속 반영하므로, --sync-search(색인만 갱신하고 종료)는
+#     처음 배포할 때 쌓여 있던 기록을 미리 옮겨 둘 때만 쓰면 됩니다.
+import argparse
+import hashlib
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from datetime import date, datetime
+
+import pymysql
+import streamlit as st
+from openai import OpenAI
+
+from inq_context import build_transcript, count_messages_tokens, find_anchor_index
+from inq_db import build_filters, connect_from_secrets, execute_ops
+from inq_export import iter_sessions
+from inq_rubric import ensure_rubric_tables, format_scores, parse_scores, score_format, score_ops, submission_key
+from inq_scheduler import OPENAI_MAX_CONCURRENCY, OPENAI_RPM, OPENAI_TPM, OpenAIScheduler
+from inq_schema import LEGACY, NORMALIZED, storage_layout
+from inq_search import sync_legacy_index
+from inq_stages import DEFAULT_STAGE, STAGES, get_stage, summary_prompt
+
+BATCH_MODEL = "gpt-4o"
+COMPLETION_TOKEN_ESTIMATE = 1000  # 분당 토큰 한도 계산에 쓰는 응답 길이 추정치
+TASKS = ("summary", "rubric")
+
+RUBRIC_INSTRUCTIONS = (
+    "위 대화에서 학생이 처음 제출한 내용을 다음 채점 기준에 따라 평가하세요.\n{criteria}\n\n"
+    "각 기준을 충족하면 met을 true, 개선이 필요하면 false로 하고, reason에 한 문장으로 근거를 쓰세요. "
+    "학생이 해당 내용을 제시하지 않았다면 false로 평가하세요."
+)
+
+RESULTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS inq_batch_results (
+        source VARCHAR(16) NOT NULL,
+        record_id BIGINT NOT NULL,
+        task VARCHAR(16) NOT NULL,
+        stage VARCHAR(32) NOT NULL,
+        content_hash CHAR(64) NOT NULL,
+        model VARCHAR(64) NOT NULL,
+        result MEDIUMTEXT NOT NULL,
+        prompt_tokens INT NOT NULL DEFAULT 0,
+        completion_tokens INT NOT NULL DEFAULT 0,
+        time DATETIME NOT NULL,
+        PRIMARY KEY (source, record_id, task)
+    ) DEFAULT CHARSET=utf8mb4
+"""
+UPSERT_RESULT = """
+    INSERT INTO inq_batch_results (source, record_id, task, stage, content_hash, model, result, prompt_tokens, completion_tokens, time)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE stage = VALUES(stage), content_hash = VALUES(content_hash), model = VALUES(model), result = VALUES(result),
+        prompt_tokens = VALUES(prompt_tokens), completion_tokens = VALUES(completion_tokens), time = VALUES(time)
+"""
+
+
+def ensure_results_table(cursor):
+    cursor.execute(RESULTS_SCHEMA)
+
+
+def rubric_prompt(stage, transcript):
+    prompt = f"다음은 학생과 {stage.assistant_name}의 대화 기록입니다:\n{transcript}\n\n"
+    return prompt + RUBRIC_INSTRUCTIONS.format(criteria="\n".join(stage.rubric))
+
+
+# Conversation turns of a stored session, without the stored page_4 summary
+def conversation(session, normalized):
+    if normalized:
+        return [m for m in session["messages"] if m.get("kind", "chat") == "chat"]
+    # 레거시 qna.chat은 요약을 마지막 assistant 메시지로 덧붙여 저장함
+    messages = session["messages"]
+    if len(messages) >= 2 and messages[-1].get("role") == messages[-2].get("role") == "assistant":
+        return messages[:-1]
+    return messages
+
+
+# Requests (one per task) for a session; empty when the student never said anything
+def build_requests(session, source, stage_key=DEFAULT_STAGE, model=BATCH_MODEL):
+    messages = conversation(session, source == NORMALIZED)
+    if not any(m.get("role") == "user" for m in messages):
+        return []
+    stage = get_stage(session["stage"] or stage_key)
+    transcript = build_transcript(messages)
+    prompts = {"summary": summary_prompt(stage, transcript), "rubric": rubric_prompt(stage, transcript)}
+    requests = []
+    for task in TASKS:
+        body = {"model": model, "messages": [{"role": "system", "content": prompts[task]}]}
+        if task == "rubric":
+            body["response_format"] = score_format(stage)
+        digest = hashlib.sha256(json.dumps(body, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+        requests.append({"source": source, "record_id": session["id"], "task": task, "stage": stage.key, "digest": digest, "body": body})
+    return requests
+
+
+def custom_id(request):
+    return ":".join([request["source"], str(request["record_id"]), request["task"], request["stage"], request["digest"]])
+
+
+def parse_custom_id(value):
+    source, record_id, task, stage, digest = value.split(":")
+    return {"source": source, "record_id": int(record_id), "task": task, "stage": stage, "digest": digest}
+
+
+# (score key, number) of a stored session; live scores use the same key, so a session is counted once
+# (정규화된 저장 방식은 session_key, 레거시 qna는 학번과 첫 제출 내용으로 만든 키)
+def record_identity(cursor, source, record_id):
+    if source == NORMALIZED:
+        cursor.execute("SELECT session_key, number FROM inq_sessions WHERE id = %s", (record_id,))
+        return cursor.fetchone()
+    cursor.execute("SELECT number, chat FROM qna WHERE id = %s", (record_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    number, chat = row
+    messages = json.loads(chat) if chat else []
+    anchor = find_anchor_index(messages)
+    if anchor is None:
+        return f"qna:{record_id}", number
+    return submission_key(number, messages[anchor]["content"]), number
+
+
+# Store one result, replacing an older result of the same session and task; rubric results also
+# update the score columns and class totals (raises ValueError when the score object is malformed)
+def store_result(db, request, model, text, prompt_tokens=0, completion_tokens=0):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ops = []
+    if request["task"] == "rubric":
+        stage = get_stage(request["stage"])
+        scores = parse_scores(text)
+        text = format_scores(scores, stage)
+        with db.cursor() as cursor:
+            identity = record_identity(cursor, request["source"], request["record_id"])
+        if identity is not None:
+            ops.extend(score_ops(identity[0], stage.key, identity[1], "batch", now, scores))
+    ops.append((UPSERT_RESULT, (
+        request["source"], request["record_id"], request["task"], request["stage"], request["digest"],
+        model, text, prompt_tokens, completion_tokens, now,
+    )))
+    # 반별 합계를 빼고 더하는 쓰기가 함께 반영되도록 한 트랜잭션으로 기록
+    db.begin()
+    try:
+        with db.cursor() as cursor:
+            execute_ops(cursor, ops)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+
+# Requests still to run for matching sessions, and how many were skipped as already done
+def pending_requests(db, conditions, params, normalized, stage_key=DEFAULT_STAGE, model=BATCH_MODEL):
+    source = NORMALIZED if normalized else LEGACY
+    with db.cursor() as cursor:
+        ensure_results_table(cursor)
+        ensure_rubric_tables(cursor)
+        cursor.execute("SELECT record_id, task, content_hash FROM inq_batch_results WHERE source = %s", (source,))
+        done = {(record_id, task): digest for record_id, task, digest in cursor.fetchall()}
+    pending = []
+    skipped = 0
+    # 요청은 오래 걸리므로 서버 측 커서를 열어 둔 채 기다리지 않고 먼저 목록을 만듦 (이미지는 제외해 가벼움)
+    with db.cursor(pymysql.cursors.SSCursor) as cursor:
+        for session in iter_sessions(cursor, conditions, params, normalized, include_images=False):
+            for request in build_requests(session, source, stage_key, model):
+                if done.get((request["record_id"], request["task"])) == request["digest"]:
+                    skipped += 1
+                else:
+                    pending.append(request)
+    return pending, skipped
+
+
+# Run requests on a bounded worker pool, storing each result as soon as it arrives; returns (done, failed)
+def run_requests(requests, client, db, scheduler, workers=OPENAI_MAX_CONCURRENCY, progress=None):
+    def call(request):
+        body = request["body"]
+        estimated_tokens = count_messages_tokens(body["messages"]) + COMPLETION_TOKEN_ESTIMATE
+        # 요청마다 다른 키로 넣어 순서대로 처리 (한도와 재시도는 앱과 같은 스케줄러가 맡음)
+        return scheduler.call(custom_id(request), lambda: client.chat.completions.create(**body), estimated_tokens)
+
+    done = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(call, request): request for request in requests}
+        for future in as_completed(futures):
+            request = futures[future]
+            try:
+                response = future.result()
+                usage = response.usage
+                store_result(
+                    db, request, response.model, response.choices[0].message.content or "",
+                    usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0
+                )
+                done += 1
+            except pymysql.MySQLError:
+                # 결과를 기록할 수 없으면 더 요청해도 버려지므로 중단 (다시 실행하면 이어서 진행)
+                for pending in futures:
+                    pending.cancel()
+                raise
+            except Exception as e:
+                failed += 1
+                print(f"실패 {custom_id(request)}: {e}", file=sys.stderr)
+            if progress is not None:
+                progress(done, failed, len(requests))
+    return done, failed
+
+
+# OpenAI Batch API input: one /v1/chat/completions request per line
+def write_batch_file(requests, f):
+    for request in requests:
+        line = {"custom_id": custom_id(request), "method": "POST", "url": "/v1/chat/completions", "body": request["body"]}
+        f.write(json.dumps(line, ensure_ascii=False))
+        f.write("\n")
+
+
+# Store the results of a Batch API output file; returns (imported, failed)
+def import_batch_output(f, db):
+    imported = 0
+    failed = 0
+    with db.cursor() as cursor:
+        ensure_results_table(cursor)
+        ensure_rubric_tables(cursor)
+    for line in f:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        try:
+            if item.get("error") or response.get("status_code") != 200:
+                raise ValueError(item.get("error") or response.get("status_code"))
+            body = response["body"]
+            usage = body.get("usage") or {}
+            store_result(
+                db, parse_custom_id(item["custom_id"]), body.get("model", ""), body["choices"][0]["message"]["content"] or "",
+                usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            )
+            imported += 1
+        except ValueError as e:
+            failed += 1
+            print(f"실패 {item.get('custom_id')}: {e}", file=sys.stderr)
+    return imported, failed
+
+
+# Stored results of one session as {task: result}
+def load_results(cursor, source, record_id):
+    cursor.execute("SELECT task, result FROM inq_batch_results WHERE source = %s AND record_id = %s", (source, record_id))
+    return dict(cursor.fetchall())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="저장된 대화마다 요약과 채점 결과를 만들어 DB에 기록합니다.")
+    parser.add_argument("--class", dest="class_prefix", default="", help="반 (예: 103)")
+    parser.add_argument("--since", type=date.fromisoformat, help="시작 날짜 (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="끝 날짜 (YYYY-MM-DD, 포함)")
+    parser.add_argument("--stage", choices=list(STAGES), default=DEFAULT_STAGE, help="단계가 저장되지 않은 레거시 기록의 탐구 단계")
+    parser.add_argument("--model", default=BATCH_MODEL)
+    parser.add_argument("--workers", type=int, default=OPENAI_MAX_CONCURRENCY, help="동시에 보내는 요청 수")
+    parser.add_argument("--batch-file", help="요청하지 않고 OpenAI Batch API 입력 파일만 작성")
+    parser.add_argument("--import-results", help="OpenAI Batch API 결과 파일을 DB에 기록")
+    parser.add_argument("--mock", action="store_true", help="모의 OpenAI 서버에 요청 (네트워크 없이 시험)")
+    parser.add_argument("--sync-search", action="store_true", help="레거시 qna의 검색 색인만 갱신하고 종료")
+    args = parser.parse_args()
+
+    with closing(connect_from_secrets()) as db:
+        if storage_layout() == LEGACY:
+            print(f"검색 색인에 {sync_legacy_index(db)}개 기록 반영", file=sys.stderr)
+        if args.sync_search:
+            sys.exit(0)
+
+        if args.import_results:
+            with open(args.import_results, encoding="utf-8") as f:
+                imported, failed = import_batch_output(f, db)
+            print(f"기록 {imported}개, 실패 {failed}개")
+            sys.exit(1 if failed else 0)
+
+        date_range = (args.since or date(2000, 1, 1), args.until or date.today()) if args.since or args.until else None
+        conditions, params = build_filters(args.class_prefix, "", date_range)
+        requests, skipped = pending_requests(db, conditions, params, storage_layout() == NORMALIZED, args.stage, args.model)
+        print(f"요청 {len(requests)}개 (이미 처리됨 {skipped}개)", file=sys.stderr)
+
+        if args.batch_file:
+            with open(args.batch_file, "w", encoding="utf-8") as f:
+                write_batch_file(requests, f)
+            sys.exit(0)
+
+        if args.mock:
+            from inq_loadtest import start_mock_server
+
+            server = start_mock_server(first_token_latency=0.05, token_delay=0.001)
+            client = OpenAI(api_key="mock-key", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+        else:
+            client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+        scheduler = OpenAIScheduler(
+            rpm=int(st.secrets.get("OPENAI_RPM", OPENAI_RPM)),
+            tpm=int(st.secrets.get("OPENAI_TPM", OPENAI_TPM)),
+            max_concurrency=args.workers
+        )
+        done, failed = run_requests(
+            requests, client, db, scheduler, args.workers,
+            progress=lambda done, failed, total: print(f"~ {done + failed}/{total}", file=sys.stderr)
+        )
+        print(f"완료 {done}개, 실패 {failed}개 (다시 실행하면 실패한 것만 요청합니다)")
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,189 @@
+# Content-addressed on-disk store for uploaded images; session state keeps only blob: references
+import base64
+import hashlib
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from inq_cache import LRUCache
+from inq_metrics import registry
+
+BLOB_MAX_BYTES = 2 * 1024 * 1024 * 1024     # 디스크에 둘 이미지 전체 용량 (넘으면 오래 안 쓴 것부터 삭제)
+BLOB_MEMORY_BYTES = 64 * 1024 * 1024        # 자주 쓰는 이미지를 메모리에 둘 용량
+SESSION_BLOB_BYTES = 30 * 1024 * 1024       # 한 세션이 올릴 수 있는 이미지 총량
+SESSION_IDLE_SECONDS = 3600                 # 이 시간 동안 rerun이 없던 세션은 메모리 집계에서 뺌
+MISSING_IMAGE_TEXT = "[이미지를 더 이상 불러올 수 없습니다]"
+
+_BLOB_URL_RE = re.compile(r"^blob:([^;,]+);sha256,([0-9a-f]{64})$")
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Images stored once per content hash under `root`, evicted least-recently-used past `max_bytes`.
+
+    Recently used blobs are also kept in a small in-memory LRU, so rehydrating the same image
+    for every API request does not hit the disk. Shared by every session of the process.
+    """
+
+    def __init__(self, root, max_bytes=BLOB_MAX_BYTES, memory_bytes=BLOB_MEMORY_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # sha256 -> size, 오래 안 쓴 것이 앞에 옴
+        self._lock = threading.Lock()
+        self._memory = LRUCache(max_entries=256, max_size=memory_bytes)
+        self.total_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        # 재시작 후에도 기존 파일을 이어서 사용 (수정 시각 = 마지막 사용 시각)
+        found = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if len(name) == 64:
+                    stat = os.stat(os.path.join(directory, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(found):
+            self._entries[digest] = size
+            self.total_bytes += size
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    # Store bytes and return their sha256; identical uploads are stored once
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                return digest
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # 다른 세션이 읽는 중에도 반쯤 쓰인 파일이 보이지 않음
+        with self._lock:
+            if digest not in self._entries:
+                self._entries[digest] = len(data)
+                self.total_bytes += len(data)
+            evicted = []
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_digest, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old_digest)
+        for old_digest in evicted:
+            self._memory.pop(old_digest)
+            try:
+                os.remove(self._path(old_digest))
+            except FileNotFoundError:
+                pass
+        self._memory.put(digest, data)
+        return digest
+
+    # Bytes of a blob, or None if it has been evicted
+    def get(self, digest):
+        data = self._memory.get(digest)
+        if data is None:
+            try:
+                with open(self._path(digest), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(digest))
+            except FileNotFoundError:
+                return None
+            self._memory.put(digest, data)
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {"blobs": len(self._entries), "disk_bytes": self.total_bytes, "memory_bytes": self._memory.size}
+
+
+@st.cache_resource
+def get_blob_store():
+    root = st.secrets.get("BLOB_DIR", os.path.join(tempfile.gettempdir(), "inq_blobs"))
+    store = BlobStore(root, max_bytes=int(st.secrets.get("BLOB_MAX_BYTES", BLOB_MAX_BYTES)))
+    registry.add_collector(lambda: {f"blob_{key}": value for key, value in store.stats().items()})
+    return store
+
+
+def blob_url(digest, mime_type):
+    return f"blob:{mime_type};sha256,{digest}"
+
+
+# (mime_type, sha256) of a blob: URL, or None for any other URL
+def parse_blob_url(url):
+    match = _BLOB_URL_RE.match(url or "")
+    return match.groups() if match else None
+
+
+# Content with blob: image references replaced by data URLs (for API requests and storage)
+def hydrate_content(content, store):
+    if not isinstance(content, list):
+        return content
+    parts = []
+    for part in content:
+        parsed = parse_blob_url(part.get("image_url", {}).get("url")) if isinstance(part, dict) and part.get("type") == "image_url" else None
+        if parsed is None:
+            parts.append(part)
+            continue
+        mime_type, digest = parsed
+        data = store.get(digest)
+        if data is None:
+            logger.warning("blob %s evicted before use", digest)
+            parts.append({"type": "text", "text": MISSING_IMAGE_TEXT})
+            continue
+        image_url = dict(part["image_url"], url=f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}")
+        parts.append({**part, "image_url": image_url})
+    return parts
+
+
+def hydrate_messages(messages, store):
+    return [{**m, "content": hydrate_content(m["content"], store)} for m in messages]
+
+
+# Rough in-memory size of a session_state value (strings and bytes dominate)
+def estimate_bytes(value, _depth=0):
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(k, _depth + 1) + estimate_bytes(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)) and _depth < 16:
+        return sys.getsizeof(value) + sum(estimate_bytes(v, _depth + 1) for v in value)
+    return sys.getsizeof(value)
+
+
+class SessionMemory:
+    """Per-session accounting of session_state size and referenced image bytes, for /metrics."""
+
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._sessions = {}  # session_key -> (state_bytes, blob_bytes, last_seen)
+        self._lock = threading.Lock()
+
+    def update(self, session_key, state_bytes, blob_bytes):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session_key] = (state_bytes, blob_bytes, now)
+            for key in [k for k, (_, _, seen) in self._sessions.items() if now - seen > self.idle_seconds]:
+                del self._sessions[key]
+
+    def snapshot(self):
+        with self._lock:
+            values = list(self._sessions.values())
+        return {
+            "sessions": len(values),
+            "session_state_bytes": sum(v[0] for v in values),
+            "session_state_bytes_max": max((v[0] for v in values), default=0),
+            "session_blob_bytes": sum(v[1] for v in values),
+        }
+
+
+session_memory = SessionMemory()
+registry.add_collector(session_memory.snapshot)
@@ -0,0 +1,69 @@
+# Thread-safe, size-bounded LRU cache shared by all sessions in the process
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """LRU cache bounded by entry count and by the total `sizeof(value)`.
+
+    Module-level instances live for the whole Streamlit process (imported modules are not
+    re-executed on rerun), so they are shared across sessions; all access is locked because
+    each session runs its script in its own thread.
+    """
+
+    def __init__(self, max_entries=128, max_size=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_size is not None else 0
+        if self.max_size is not None and size > self.max_size:
+            return  # 혼자서 한도를 넘는 값은 캐시하지 않음
+        with self._lock:
+            if key in self._data:
+                self._size -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self._size += size
+            while len(self._data) > self.max_entries or (self.max_size is not None and self._size > self.max_size):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._size -= evicted_size
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, size = self._data.pop(key)
+            self._size -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    @property
+    def size(self):
+        return self._size
@@ -0,0 +1,174 @@
+# Token-budgeted chat context with a rolling summary of older turns
+import functools
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken이 없으면 바이트 길이로 추정
+    tiktoken = None
+
+MESSAGE_OVERHEAD_TOKENS = 4   # 메시지마다 붙는 role/구분자 토큰
+IMAGE_TOKENS_HIGH = 765       # detail=high(1024x1024 기준) 이미지 한 장
+IMAGE_TOKENS_LOW = 85         # detail=low 이미지 한 장
+ANCHOR_MIN_CHARS = 40         # 이보다 짧은 첫 메시지("안녕" 등)는 원본 제출물로 보지 않음
+RECENT_RATIO = 0.6            # 요약을 갱신할 때 최근 대화를 예산의 이 비율까지 줄여 갱신 빈도를 낮춤
+SUMMARY_PREFIX = "지금까지의 이전 대화 요약입니다:\n\n"
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")  # gpt-4o 계열 인코딩
+    except Exception:
+        # 인코딩 파일을 내려받을 수 없는 오프라인 환경
+        return None
+
+
+# Count tokens of a plain string
+@functools.lru_cache(maxsize=4096)
+def count_text_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 한글은 글자당 약 1토큰, 영문은 약 4글자당 1토큰이므로 UTF-8 바이트/3이 보수적인 추정치
+    return (len(text.encode("utf-8")) + 2) // 3
+
+
+# Count tokens of message content (str or multimodal list)
+def count_content_tokens(content):
+    if isinstance(content, str):
+        return count_text_tokens(content)
+    parts = content if isinstance(content, list) else [content]
+    total = 0
+    for part in parts:
+        if not isinstance(part, dict):
+            total += count_text_tokens(str(part))
+        elif part.get("type") == "text":
+            total += count_text_tokens(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            detail = part.get("image_url", {}).get("detail")
+            total += IMAGE_TOKENS_LOW if detail == "low" else IMAGE_TOKENS_HIGH
+    return total
+
+
+def count_message_tokens(message):
+    return MESSAGE_OVERHEAD_TOKENS + count_content_tokens(message["content"])
+
+
+def count_messages_tokens(messages):
+    return sum(count_message_tokens(m) for m in messages)
+
+
+# Plain-text view of a message, with images replaced by a placeholder
+def message_text(content, image_placeholder="[이미지]"):
+    if isinstance(content, str):
+        return content
+    parts = content if isinstance(content, list) else [content]
+    texts = []
+    for part in parts:
+        if not isinstance(part, dict):
+            texts.append(str(part))
+        elif part.get("type") == "text":
+            texts.append(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            texts.append(image_placeholder)
+    return "\n".join(texts)
+
+
+# Compact "role: text" transcript; images become short placeholders instead of base64 data URLs
+def build_transcript(messages, image_placeholder="[학생이 업로드한 이미지]"):
+    return "\n".join(f"{m['role']}: {message_text(m['content'], image_placeholder)}" for m in messages)
+
+
+def has_image(content):
+    parts = content if isinstance(content, list) else [content]
+    return any(isinstance(p, dict) and p.get("type") == "image_url" for p in parts)
+
+
+# Whether a student message looks like a submission rather than a greeting or short question
+def is_submission(content):
+    return has_image(content) or len(message_text(content).strip()) >= ANCHOR_MIN_CHARS
+
+
+# Index of the student's original submission (hypothesis/method or data/conclusion)
+def find_anchor_index(history):
+    first_user = None
+    for i, message in enumerate(history):
+        if message["role"] != "user":
+            continue
+        if first_user is None:
+            first_user = i
+        if is_submission(message["content"]):
+            return i
+    return first_user
+
+
+# Start index of the longest suffix of whole turns that fits in the budget
+def _recent_start(history, lower, budget):
+    start = len(history)
+    used = 0
+    for i in range(len(history) - 1, lower - 1, -1):
+        used += count_message_tokens(history[i])
+        if used > budget:
+            break
+        # 질문/답변 쌍이 잘리지 않도록 사용자 메시지에서만 경계를 잡음
+        if history[i]["role"] == "user":
+            start = i
+    return start
+
+
+class ContextWindow:
+    """Keeps recent turns verbatim and folds older ones into a cached running summary.
+
+    `state` is a plain dict (kept in st.session_state) holding the summary text and the
+    history index it covers, so each fold only summarizes the newly dropped turns.
+    `summarize(previous_summary, messages)` returns the updated summary or None on failure.
+    """
+
+    def __init__(self, budget, summarize, summary_budget=800):
+        self.budget = budget
+        self.summarize = summarize
+        self.summary_budget = summary_budget
+
+    def build(self, history, state, reserved_tokens=0):
+        if state.get("summarized_upto", 0) > len(history):
+            # 대화가 초기화된 경우
+            state.clear()
+        summarized_upto = state.get("summarized_upto", 0)
+        summary = state.get("summary", "")
+
+        anchor = find_anchor_index(history)
+        anchor_tokens = count_message_tokens(history[anchor]) if anchor is not None else 0
+        available = self.budget - reserved_tokens - anchor_tokens
+        if count_messages_tokens(history[summarized_upto:]) <= available - self._summary_tokens(summary):
+            return self._assemble(history, anchor, summary, summarized_upto)
+
+        recent_budget = available - self.summary_budget
+        start = _recent_start(history, summarized_upto, recent_budget)
+
+        if start > summarized_upto:
+            # 예산을 넘었으므로 최근 대화를 목표 비율까지 줄이고 밀려난 부분만 요약에 추가
+            target = _recent_start(history, summarized_upto, int(recent_budget * RECENT_RATIO))
+            if target < len(history):
+                start = target
+            folded = [m for i, m in enumerate(history[summarized_upto:start], summarized_upto) if i != anchor]
+            new_summary = self.summarize(summary, folded) if folded else summary
+            if new_summary is not None:
+                summary = new_summary
+                summarized_upto = start
+                state["summary"] = summary
+                state["summarized_upto"] = summarized_upto
+        return self._assemble(history, anchor, summary, start)
+
+    def _summary_tokens(self, summary):
+        return count_text_tokens(SUMMARY_PREFIX + summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+
+    def _assemble(self, history, anchor, summary, start):
+        messages = []
+        if anchor is not None and anchor < start:
+            messages.append(history[anchor])
+        if summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+        messages.extend(history[start:])
+        return messages
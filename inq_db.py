@@ -0,0 +1,149 @@
+# Process-wide MySQL connection pool shared by the student and teacher apps
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import groupby
+
+import pymysql
+import streamlit as st
+
+DB_POOL_SIZE = 10          # 동시에 열 수 있는 최대 연결 수
+DB_POOL_TIMEOUT = 10       # 연결을 기다리는 최대 시간(초)
+DB_MAX_IDLE = 300          # 이보다 오래 쉬고 있던 연결은 닫고 새로 연결(서버 wait_timeout 대비)
+DB_PING_AFTER = 30         # 이보다 오래 쉬고 있던 연결은 꺼낼 때 ping으로 확인
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, max_idle=DB_MAX_IDLE, ping_after=DB_PING_AFTER):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._idle = []  # (connection, last_used) - 가장 최근에 쓴 연결이 뒤에 옴
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.in_use = 0
+
+    # Called with a slot held, so the connection count stays within max_size without holding the lock
+    def _checkout(self):
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                # 새 연결은 잠금 밖에서 맺어 다른 스레드의 반납과 stats()를 막지 않음
+                return self._connect()
+            conn, last_used = item
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.max_idle:
+                self._close(conn)
+                continue
+            if idle_for > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.MySQLError:
+                    self._close(conn)
+                    continue
+            return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # Borrow a connection; it is returned to the pool on exit, or discarded on error
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeoutError(2013, f"DB 연결 대기 시간({self.timeout}초)을 초과했습니다.")
+        conn = None
+        try:
+            conn = self._checkout()
+            with self._lock:
+                self.in_use += 1
+            try:
+                yield conn
+            except BaseException:
+                # 오류가 난 연결은 상태를 알 수 없으므로 재사용하지 않음
+                self._close(conn)
+                conn = None
+                raise
+            finally:
+                with self._lock:
+                    self.in_use -= 1
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {"in_use": self.in_use, "idle": len(self._idle), "max_size": self.max_size}
+
+
+def connect_from_secrets():
+    return pymysql.connect(
+        host=st.secrets["DB_HOST"],
+        port=int(st.secrets.get("DB_PORT", 3306)),
+        user=st.secrets["DB_USER"],
+        password=st.secrets["DB_PASSWORD"],
+        database=st.secrets["DB_DATABASE"],
+        charset="utf8mb4",
+        autocommit=True,  # 재사용되는 연결이 오래된 스냅샷을 읽지 않도록 항상 autocommit
+        connect_timeout=DB_POOL_TIMEOUT
+    )
+
+
+@st.cache_resource
+def get_pool():
+    return ConnectionPool(
+        connect_from_secrets,
+        max_size=int(st.secrets.get("DB_POOL_SIZE", DB_POOL_SIZE))
+    )
+
+
+# Run (sql, params) writes, batching consecutive ones with the same SQL into one executemany
+def execute_ops(cursor, ops):
+    for sql, group in groupby(ops, key=lambda op: op[0]):
+        cursor.executemany(sql, [params for _, params in group])
+
+
+# Create an index if it does not exist yet (MySQL has no CREATE INDEX IF NOT EXISTS)
+def ensure_index(table, name, columns, fulltext=False):
+    with get_pool().connection() as db:
+        with db.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+                (table, name)
+            )
+            if cursor.fetchone() is None:
+                if fulltext:
+                    # 한국어는 띄어쓰기 단위로 색인하면 조사 때문에 검색이 안 되므로 ngram 파서 사용
+                    cursor.execute(f"CREATE FULLTEXT INDEX `{name}` ON `{table}` ({columns}) WITH PARSER ngram")
+                else:
+                    cursor.execute(f"CREATE INDEX `{name}` ON `{table}` ({columns})")
+
+
+# Record filters as an SQL WHERE fragment on number/time (모두 인덱스를 탈 수 있는 범위 조건)
+def build_filters(class_prefix, student_number, date_range):
+    conditions = []
+    params = []
+    if student_number:
+        conditions.append("number = %s")
+        params.append(student_number)
+    elif class_prefix:
+        # 학번 10312 = 1학년 03반 12번 이므로 반 103은 10300 이상 10400 미만
+        conditions.append("number >= %s AND number < %s")
+        params.extend([f"{class_prefix}00", f"{int(class_prefix) + 1}00"])
+    if date_range:
+        start, end = date_range
+        conditions.append("time >= %s AND time < %s")
+        params.extend([start, end + timedelta(days=1)])
+    return conditions, params
@@ -0,0 +1,834 @@
+# Streamlit-based chatbot engine for scientific inquiry support, shared by all stages in one process
+import streamlit as st
+from openai import OpenAI
+import json
+from datetime import datetime
+from dotenv import load_dotenv
+import base64
+import hashlib
+import logging
+import time
+import uuid
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from inq_blobs import MISSING_IMAGE_TEXT, SESSION_BLOB_BYTES, blob_url, estimate_bytes, get_blob_store, hydrate_messages, parse_blob_url, session_memory
+from inq_cache import LRUCache
+from inq_context import ContextWindow, build_transcript, count_messages_tokens, is_submission, message_text
+from inq_image import image_settings, preprocess_image
+from inq_metrics import log_turn, registry, serve_metrics, timed, turn_metrics_ops
+from inq_pdf import PdfTooLargeError, extract_pdf_text as extract_pdf_bytes
+from inq_retrieval import document_overview, retrieve_context
+from inq_router import get_router
+from inq_rubric import SCORING_INSTRUCTIONS, parse_scores, score_format, score_ops, submission_key
+from inq_scheduler import get_scheduler
+from inq_schema import NORMALIZED, message_write_ops, session_write_ops, storage_layout, summary_write_ops
+from inq_stages import get_stage, summary_prompt
+
+STREAM_RESPONSES = True  # 응답을 토큰 단위로 화면에 표시
+SUMMARY_TOKEN_BUDGET = 800  # 이전 대화 요약의 최대 길이
+PDF_TOP_K = 4  # 한 턴에 첨부할 PDF 청크 수
+PDF_CONTEXT_TOKENS = 1500  # PDF 발췌문 토큰 상한
+PDF_PINNED_TOKENS = 800  # 고정 위치에 한 번만 넣는 PDF 앞부분(개요) 토큰 상한
+COMPLETION_TOKEN_ESTIMATE = 1000  # 분당 토큰 한도 계산에 쓰는 응답 길이 추정치
+SCORING_MAX_TOKENS = 800  # 채점 결과(JSON) 응답 길이 상한
+SCORING_WORKERS = 2  # 평가 턴의 채점을 처리하는 백그라운드 스레드 수
+HISTORY_PAGE_TURNS = 5  # 누적 대화 목록에서 한 페이지에 보여줄 질문/답변 수
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024  # 화면 표시용으로 디코딩한 이미지 캐시 상한 (세션 간 공유)
+
+_image_bytes_cache = LRUCache(max_entries=512, max_size=IMAGE_CACHE_BYTES)
+
+logger = logging.getLogger(__name__)
+
+# Initialize OpenAI client (프로세스당 한 번만 만들어 rerun 사이에도 keep-alive 연결을 재사용)
+@st.cache_resource
+def get_openai_client():
+    # Load environment variables
+    load_dotenv()
+    return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+
+# Client for one routed call (다음 후보 모델이 남아 있으면 클라이언트 자체 재시도 없이 바로 넘어감)
+def openai_client(choice):
+    return get_openai_client().with_options(timeout=choice.timeout, max_retries=choice.max_retries)
+
+# Run an OpenAI call through the process-wide scheduler, showing the queue position while it waits
+# fn(choice)는 라우터가 경로(route, 기본은 call)에 따라 고른 choice.model로 요청하고, 시간 초과나 서버 오류면 다음 후보 모델로 다시 호출됨
+# (대기 시간과 전체 소요 시간은 지표로 기록하고, timing이 주어지면 거기에도 남김)
+def schedule_openai(fn, messages, max_tokens=None, placeholder=None, call="chat", timing=None, route=None):
+    prompt_tokens = count_messages_tokens(messages)
+    completion_tokens = max_tokens or COMPLETION_TOKEN_ESTIMATE
+    estimated_tokens = prompt_tokens + completion_tokens
+    session_key = st.session_state.setdefault("session_key", uuid.uuid4().hex)
+    on_wait = None
+    if placeholder is not None:
+        on_wait = lambda position: placeholder.info(f"⏳ 대기 중 ({position}번째)")
+    timing = {} if timing is None else timing
+    labels = {"stage": current_stage().key, "call": call}
+    timing["route"] = route or call
+    started = time.perf_counter()
+
+    def attempt(choice):
+        timing["model"] = choice.model
+
+        def admitted():
+            # 429로 다시 시도하면 마지막으로 슬롯을 얻기까지의 시간이 대기 시간
+            timing["queue_wait"] = time.perf_counter() - started
+            call_started = time.perf_counter()
+            try:
+                return fn(choice)
+            finally:
+                # 모델별 지연 통계에는 대기 시간을 빼고 기록
+                choice.elapsed = time.perf_counter() - call_started
+
+        return get_scheduler().call(session_key, admitted, estimated_tokens, on_wait)
+
+    try:
+        return get_router().run(timing["route"], labels["stage"], attempt, prompt_tokens, completion_tokens)
+    finally:
+        timing["total"] = time.perf_counter() - started
+        if "queue_wait" in timing:
+            registry.observe("openai_queue_wait", timing["queue_wait"], **labels)
+        registry.observe("openai_total", timing["total"], **labels)
+
+# 현재 세션의 탐구 단계 (run()에서 지정)
+def current_stage():
+    return get_stage(st.session_state.get("stage_key"))
+
+# Store uploaded image in the blob store (회전 보정, 축소, 재압축 후 blob: 참조, detail 수준, 바이트 수를 반환)
+def encode_image(uploaded_file):
+    # 첨부가 그대로인 동안 rerun마다 다시 처리하지 않음
+    upload_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    cached = st.session_state.get("encoded_upload")
+    if cached and cached[0] == upload_key:
+        return cached[1]
+    max_side, fmt = image_settings()
+    data, mime_type, detail = preprocess_image(
+        uploaded_file.getvalue(),
+        max_side=max_side,
+        fmt=fmt,
+        fallback_mime=uploaded_file.type
+    )
+    digest = get_blob_store().put(data)
+    result = (blob_url(digest, mime_type), detail, len(data))
+    st.session_state["encoded_upload"] = (upload_key, result)
+    return result
+
+# Count an image against this session's upload cap; False when it would exceed SESSION_BLOB_BYTES
+def reserve_session_blob(url, size):
+    blobs = st.session_state.setdefault("session_blobs", {})  # blob: 참조 -> 바이트 수
+    if url in blobs:
+        return True
+    if sum(blobs.values()) + size > SESSION_BLOB_BYTES:
+        return False
+    blobs[url] = size
+    return True
+
+# Fold older turns into the running summary
+def summarize_history(previous_summary, messages):
+    transcript = build_transcript(messages)
+    prompt = (
+        "다음은 학생과 챗봇의 이전 대화 요약과, 요약 이후에 이어진 대화입니다. "
+        "두 내용을 합쳐 요약을 갱신하세요. "
+        "채점 기준별로 어떤 피드백을 했는지, 학생이 무엇을 어떻게 개선했는지, "
+        "현재 몇 단계인지(1단계: 학생 질문, 2단계: 챗봇 질문), 2단계에서 챗봇이 한 질문의 수를 빠뜨리지 마세요."
+    )
+    messages = [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": f"[이전 요약]\n{previous_summary or '없음'}\n\n[이어진 대화]\n{transcript}"}
+    ]
+    try:
+        timing = {}
+        response = schedule_openai(
+            lambda choice: openai_client(choice).chat.completions.create(
+                model=choice.model,
+                messages=messages,
+                max_tokens=SUMMARY_TOKEN_BUDGET
+            ),
+            messages,
+            max_tokens=SUMMARY_TOKEN_BUDGET,
+            call="summary",
+            timing=timing
+        )
+        record_usage(response.usage, timing)
+        return response.choices[0].message.content
+    except Exception:
+        # 요약에 실패하면 이전 요약을 유지하고 다음 턴에 다시 시도
+        return None
+
+# Prompt token budget for a stage; secrets CONTEXT_TOKEN_BUDGET is one number for every stage or a table by stage key:
+#   [CONTEXT_TOKEN_BUDGET]
+#   analysis = 16000
+def context_budget(stage):
+    budget = st.secrets.get("CONTEXT_TOKEN_BUDGET", stage.context_budget)
+    if isinstance(budget, Mapping):
+        budget = budget.get(stage.key, stage.context_budget)
+    return int(budget)
+
+@st.cache_resource
+def get_context_window(stage_key):
+    return ContextWindow(context_budget(get_stage(stage_key)), summarize_history, summary_budget=SUMMARY_TOKEN_BUDGET)
+
+# Pin a PDF's overview once; pinned documents keep their position so the prompt prefix stays stable
+def pin_pdf(text):
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    pinned = st.session_state.setdefault("pinned_docs", [])
+    if not any(doc["digest"] == digest for doc in pinned):
+        pinned.append({"digest": digest, "overview": document_overview(text, PDF_PINNED_TOKENS)})
+
+# Record per-turn token usage, including prompt tokens served from the provider's prompt cache
+# (timing에 기록된 경로와 모델별로도 집계해 라우팅 표를 조정할 때 참고)
+def record_usage(usage, timing=None):
+    if usage is None:
+        return {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    entry = count_usage(usage, current_stage().key, timing)
+    st.session_state.setdefault("usage_log", []).append(entry)
+    return entry
+
+# Add a response's token usage to the process-wide counters (세션 상태를 쓰지 않으므로 백그라운드 스레드에서도 호출 가능)
+def count_usage(usage, stage_key, timing=None):
+    details = getattr(usage, "prompt_tokens_details", None)
+    entry = {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+        "completion_tokens": usage.completion_tokens,
+    }
+    for kind in ("prompt", "cached", "completion"):
+        registry.inc("tokens", entry[f"{kind}_tokens"], stage=stage_key, type=kind)
+        if timing and "model" in timing:
+            registry.inc("route_tokens", entry[f"{kind}_tokens"], route=timing["route"], model=timing["model"], type=kind)
+    return entry
+
+# Log one answered turn and queue it for the teacher app's summary (지표는 잃어도 되므로 어떤 오류도 턴을 실패시키지 않음)
+def record_turn(timing, usage_entry):
+    record = {
+        "session_key": st.session_state.setdefault("session_key", uuid.uuid4().hex),
+        "turn_index": len(st.session_state["messages"]) // 2 - 1,
+        "stage": current_stage().key,
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "queue_wait": timing.get("queue_wait", 0.0),
+        "first_token": timing.get("first_token"),
+        "total": timing.get("total", 0.0),
+        "route": timing.get("route"),
+        "model": timing.get("model"),
+        **usage_entry,
+    }
+    log_turn(record)
+
+    from inq_writer import get_writer
+
+    try:
+        # 테이블은 writer 스레드가 만들므로 여기서는 큐에 넣기만 함
+        get_writer().submit_many(turn_metrics_ops(record))
+    except Exception as e:
+        logger.warning("turn metrics not stored: %s", e)
+
+# Background threads that score evaluation turns (학생의 턴은 채점을 기다리지 않음)
+@st.cache_resource
+def get_scoring_executor():
+    return ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="inq-rubric")
+
+# Turn the evaluation just shown to the student into a structured score object and queue it for storage
+# (세션 상태는 지금 읽어 두고 요청과 저장은 백그라운드에서 실행, 실패하면 경고만 남기고 inq_batch.py가 나중에 채점)
+def score_evaluation(messages, answer, content):
+    from inq_writer import get_writer
+
+    stage = current_stage()
+    session_key = st.session_state.setdefault("session_key", uuid.uuid4().hex)
+    number = st.session_state.get("user_number", "").strip()
+    # 레거시 qna 행에는 session_key가 없으므로 배치 작업이 같은 세션을 찾을 수 있는 키로 저장 (다시 채점하면 덮어씀)
+    score_key = session_key if storage_layout() == NORMALIZED else submission_key(number, content)
+    scoring_messages = messages + [
+        {"role": "assistant", "content": answer},
+        {"role": "system", "content": SCORING_INSTRUCTIONS},
+    ]
+    prompt_tokens = count_messages_tokens(scoring_messages)
+    client, scheduler, router, writer = get_openai_client(), get_scheduler(), get_router(), get_writer()
+    timing = {"route": "rubric"}
+
+    def attempt(choice):
+        timing["model"] = choice.model
+
+        def admitted():
+            call_started = time.perf_counter()
+            try:
+                return client.with_options(timeout=choice.timeout, max_retries=choice.max_retries).chat.completions.create(
+                    model=choice.model,
+                    messages=scoring_messages,
+                    response_format=score_format(stage),
+                    max_tokens=SCORING_MAX_TOKENS
+                )
+            finally:
+                choice.elapsed = time.perf_counter() - call_started
+
+        return scheduler.call(session_key, admitted, prompt_tokens + SCORING_MAX_TOKENS)
+
+    def score():
+        try:
+            response = router.run("rubric", stage.key, attempt, prompt_tokens, SCORING_MAX_TOKENS)
+            if response.usage is not None:
+                count_usage(response.usage, stage.key, timing)
+            scores = parse_scores(response.choices[0].message.content)
+            writer.submit_many(score_ops(score_key, stage.key, number, "live", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), scores))
+        except Exception as e:
+            logger.warning("rubric scores not produced: %s", e)
+
+    get_scoring_executor().submit(score)
+
+# Stream response tokens into a placeholder; returns (answer, usage)
+def stream_chat_completion(messages, placeholder, choice, timing=None):
+    stream = openai_client(choice).chat.completions.create(
+        model=choice.model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}  # 마지막 청크에 토큰 사용량이 담겨 옴
+    )
+    answer = ""
+    usage = None
+    started = time.perf_counter()
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not answer:
+                    first_token = time.perf_counter() - started
+                    registry.observe("openai_first_token", first_token, stage=current_stage().key)
+                    if timing is not None:
+                        timing["first_token"] = first_token
+                answer += delta
+                placeholder.markdown(answer + "▌")
+    finally:
+        # 중간에 오류가 나거나 사용자가 다른 버튼을 눌러 스크립트가 중단되어도 연결을 정리
+        stream.close()
+    placeholder.markdown(answer)
+    return answer, usage
+
+# Generate response from OpenAI - 수정된 함수
+def get_chatgpt_response(content, pdf_context=None, placeholder=None):
+    # 프롬프트 캐시가 잘 맞도록 변하지 않는 부분을 앞에 둠:
+    # 시스템 프롬프트 → 채점 기준 → 고정된 첨부 문서 → 대화 기록 → 이번 턴에만 쓰는 PDF 발췌 → 현재 입력
+    stage = current_stage()
+    messages = [
+        {"role": "system", "content": stage.prompt},
+        {"role": "system", "content": stage.rubric_prompt},
+    ]
+
+    # 첨부했던 PDF의 앞부분은 처음 첨부한 순서대로 고정 (PDF를 지우거나 다시 올려도 위치가 바뀌지 않음)
+    for doc in st.session_state.get("pinned_docs", []):
+        messages.append({"role": "system", "content": f"학생이 참고한 PDF 문서의 앞부분입니다:\n\n{doc['overview']}"})
+
+    # PDF 컨텍스트가 있으면 현재 질문과 관련된 부분만 마지막에 추가
+    tail = []
+    if pdf_context:
+        excerpt = retrieve_context(pdf_context, message_text(content), k=PDF_TOP_K, token_budget=PDF_CONTEXT_TOKENS)
+        tail.append({"role": "system", "content": f"학생이 참고한 PDF 문서에서 질문과 관련된 부분입니다:\n\n{excerpt}"})
+
+    # 기존 대화 기록 추가 (예산을 넘는 오래된 대화는 요약으로 대체, 학생의 첫 제출 내용은 항상 유지)
+    current = {"role": "user", "content": content}
+    reserved_tokens = count_messages_tokens(messages + tail + [current])
+    context_state = st.session_state.setdefault("context_state", {})
+    messages.extend(get_context_window(stage.key).build(st.session_state["messages"], context_state, reserved_tokens))
+
+    # 현재 사용자 입력 추가
+    messages.extend(tail)
+    messages.append(current)
+
+    # 세션에는 이미지 참조만 있으므로 요청을 보낼 때만 실제 이미지로 바꿈
+    messages = hydrate_messages(messages, get_blob_store())
+
+    # 학생의 첫 제출을 채점 기준별로 평가하는 턴은 큰 모델, 이후의 짧은 질문과 답변은 빠른 모델로 보냄
+    route = "evaluation" if is_submission(content) and not st.session_state.get("evaluated") else "followup"
+
+    try:
+        # 요청이 몰리면 429로 실패하는 대신 차례를 기다림 (스트리밍이 끝날 때까지 슬롯을 점유)
+        timing = {}
+        if STREAM_RESPONSES and placeholder is not None:
+            answer, usage = schedule_openai(
+                lambda choice: stream_chat_completion(messages, placeholder, choice, timing),
+                messages,
+                placeholder=placeholder,
+                timing=timing,
+                route=route
+            )
+        else:
+            response = schedule_openai(
+                lambda choice: openai_client(choice).chat.completions.create(
+                    model=choice.model,
+                    messages=messages
+                ),
+                messages,
+                timing=timing,
+                route=route
+            )
+            answer = response.choices[0].message.content
+            usage = response.usage
+        usage_entry = record_usage(usage, timing)
+
+        if not answer:
+            st.error("❌ ChatGPT 응답이 비어 있습니다. 다시 시도해주세요.")
+            return None
+
+        # 세션에 메시지들 저장 (스트리밍이 끝난 뒤에만 기록)
+        st.session_state["messages"].append({"role": "user", "content": content})
+        st.session_state["messages"].append({"role": "assistant", "content": answer})
+        record_turn(timing, usage_entry)
+        if route == "evaluation":
+            st.session_state["evaluated"] = True
+
+        # 학생의 첫 제출에 대한 평가 턴이면 채점 결과를 항목별 점수로도 남김 (교사용 앱의 반별 분포)
+        if route == "evaluation":
+            try:
+                score_evaluation(messages, answer, content)
+            except Exception as e:
+                logger.warning("rubric scoring not queued: %s", e)
+
+        # 질문/답변 쌍을 바로 DB에 기록 (탭을 닫아도 대화가 남도록)
+        if storage_layout() == NORMALIZED:
+            persist_session(st.session_state["messages"])
+        
+        # 최근 대화 저장
+        st.session_state["recent_message"] = {"user": content, "assistant": answer}
+        
+        return answer
+    except Exception as e:
+        # 스트리밍 도중 실패하면 일부만 표시된 답변은 지우고 기록하지 않음
+        if placeholder is not None:
+            placeholder.empty()
+        st.error(f"❌ ChatGPT 응답 오류: {e}")
+        return None
+     
+
+# Append turns not stored yet (and the final summary) to this session's rows
+def persist_session(messages, summary=None):
+    number = st.session_state.get('user_number', '').strip()
+    name = st.session_state.get('user_name', '').strip()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # DB 모듈은 저장이 필요할 때만 불러옴 (테이블은 writer 스레드가 첫 쓰기 전에 만듦)
+    from inq_writer import get_writer
+
+    try:
+        # (session_key, turn_index) 기준 upsert이므로 rerun이나 이전/다음 이동으로 다시 기록해도 중복되지 않음
+        session_key = st.session_state.setdefault("session_key", uuid.uuid4().hex)
+        start = min(st.session_state.get("persisted_turns", 0), len(messages))
+        ops = session_write_ops(session_key, current_stage().key, number, name, now)
+        store = get_blob_store()
+        for turn_index in range(start, len(messages)):
+            ops.extend(message_write_ops(session_key, turn_index, hydrate_messages([messages[turn_index]], store)[0]))
+        if summary is not None:
+            ops.extend(summary_write_ops(session_key, summary))
+        get_writer().submit_many(ops)
+        st.session_state["persisted_turns"] = len(messages)
+        return True
+    except Exception as e:
+        st.error(f"알 수 없는 오류가 발생했습니다: {e}")
+        return False
+
+
+# Save to MySQL database (백그라운드 writer에 맡기고 바로 반환)
+def save_to_db(all_data):
+    number = st.session_state.get('user_number', '').strip()
+    name = st.session_state.get('user_name', '').strip()
+
+    if not number or not name:
+        st.error("사용자 학번과 이름을 입력해야 합니다.")
+        return False
+
+    # DB가 느리거나 끊겨 있어도 writer가 재시도하고 로컬 스풀에 보관했다가 다시 전송
+    if storage_layout() == NORMALIZED:
+        # 대화는 턴마다 이미 기록되었으므로 남은 턴과 요약만 같은 세션에 추가
+        return persist_session(all_data[:-1], summary=all_data[-1])
+
+    from inq_writer import get_writer
+
+    try:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        sql = """
+            INSERT INTO qna (number, name, chat, time)
+            VALUES (%s, %s, %s, %s)
+        """
+        # 저장하는 기록은 교사용 앱에서 바로 볼 수 있도록 이미지를 data URL로 포함
+        chat = json.dumps(hydrate_messages(all_data, get_blob_store()), ensure_ascii=False)
+
+        # 같은 내용을 이미 저장했다면 다시 넣지 않음 (page_4를 여러 번 방문하는 경우)
+        digest = hashlib.sha256(chat.encode("utf-8")).hexdigest()
+        if st.session_state.get("saved_digest") == digest:
+            return True
+
+        val = (number, name, chat, now)
+        get_writer().submit(sql, val)
+        st.session_state["saved_digest"] = digest
+        return True
+    except Exception as e:
+        st.error(f"알 수 없는 오류가 발생했습니다: {e}")
+        return False
+
+
+# pdf extract (파일 내용의 해시로 캐시되어 rerun마다 다시 파싱하지 않음)
+def extract_pdf_text(file):
+    return extract_pdf_bytes(file.getvalue())
+
+# Image source for st.image: blob references and data URLs become bytes, which Streamlit serves by /media URL
+def image_source(url):
+    parsed = parse_blob_url(url)
+    if parsed is not None:
+        return get_blob_store().get(parsed[1])
+    if not url.startswith("data:"):
+        return url
+    data = _image_bytes_cache.get(url)
+    if data is None:
+        data = base64.b64decode(url.split(",", 1)[1])
+        _image_bytes_cache.put(url, data)
+    return data
+
+def display_image(url):
+    source = image_source(url)
+    if source is None:
+        st.write(MISSING_IMAGE_TEXT)
+    else:
+        st.image(source, caption="업로드한 이미지", width=300)
+
+# 콘텐츠 표시 헬퍼 함수
+def display_content(content):
+    if isinstance(content, list):
+        for part in content:
+            if part.get("type") == "text":
+                st.write(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                display_image(part["image_url"]["url"])
+    elif isinstance(content, dict):
+        if content.get("type") == "text":
+            st.write(content.get("text", ""))
+        elif content.get("type") == "image_url":
+            display_image(content["image_url"]["url"])
+    else:
+        # 문자열이고 base64 데이터가 포함된 경우 체크
+        if isinstance(content, str) and "data:image" in content:
+            st.write("📷 이미지가 업로드되었습니다.")
+        else:
+            st.write(content)
+
+# Page 1: User info input
+def page_1():
+    st.title(current_stage().app_title)
+    st.write("학번과 이름을 입력한 뒤 '다음' 버튼을 눌러주세요.")
+
+    if "user_number" not in st.session_state:
+        st.session_state["user_number"] = ""
+    if "user_name" not in st.session_state:
+        st.session_state["user_name"] = ""
+
+    st.session_state["user_number"] = st.text_input("학번", value=st.session_state["user_number"])
+    st.session_state["user_name"] = st.text_input("이름", value=st.session_state["user_name"])
+
+    if st.button("다음"):
+        if not st.session_state["user_number"].strip() or not st.session_state["user_name"].strip():
+            st.error("학번과 이름을 모두 입력해주세요.")
+        else:
+            st.session_state["step"] = 2
+            st.rerun()
+
+# Page 2: Instruction
+def page_2():
+    stage = current_stage()
+    st.title(f"{stage.helper_name} 활용 방법")
+    st.write(stage.instructions)
+    
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        if st.button("이전"):
+            st.session_state["step"] = 1
+            st.rerun()
+            
+    with col2:
+        if st.button("다음"):
+            st.session_state["step"] = 3
+            st.rerun()
+
+
+# Page 3: Chat interface with Form
+def page_3():
+    stage = current_stage()
+    st.title(f"{stage.helper_name} 활용하기")
+    st.write(stage.chat_description)
+
+    # 세션 초기화
+    if "messages" not in st.session_state:
+        st.session_state["messages"] = []
+    
+    if "recent_message" not in st.session_state:
+        st.session_state["recent_message"] = {"user": "", "assistant": ""}
+
+    # 입력창과 누적 대화는 각각 fragment로 나눠, 전송이나 페이지 이동 때 해당 부분만 다시 그림
+    chat_panel(stage)
+    history_panel(stage)
+
+    # 이전/다음 버튼
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        if st.button("이전"):
+            st.session_state["step"] = 2
+            st.rerun()
+            
+    with col2:
+        if st.button("다음"):
+            st.session_state["step"] = 4
+            st.session_state["feedback_saved"] = False  # 피드백 재생성 플래그 초기화
+            st.rerun()
+
+
+# Chat form, attachment and the latest turn; submitting reruns only this fragment
+@st.fragment
+def chat_panel(stage):
+    # Form을 사용하여 입력창 관리
+    with st.form(key="chat_form", clear_on_submit=True):
+        user_input = st.text_area("You: ", height=100, placeholder="질문을 입력하세요...")
+        
+        # 전송 버튼
+        submit_button = st.form_submit_button("전송")
+    
+    # 파일 업로드는 form 밖에서 처리
+    uploaded_file = st.file_uploader("📎 참고할 PDF 또는 이미지 파일을 업로드하세요:", type=["pdf", "png", "jpg", "jpeg"])
+
+    extracted_pdf_text = None
+    image_url = None
+    image_detail = None
+
+    if uploaded_file:
+        if uploaded_file.type == "application/pdf":
+            try:
+                with timed("pdf_extract", stage=stage.key):
+                    extracted_pdf_text = extract_pdf_text(uploaded_file)
+                pin_pdf(extracted_pdf_text)
+                st.success("✅ PDF 문서를 성공적으로 불러왔어요!")
+            except PdfTooLargeError as e:
+                st.warning(str(e))
+            except Exception as e:
+                st.error(f"PDF 문서를 읽는 중 오류가 발생했습니다: {e}")
+        elif uploaded_file.type.startswith("image/"):
+            with timed("image_encode", stage=stage.key):
+                image_url, image_detail, image_size = encode_image(uploaded_file)
+            if reserve_session_blob(image_url, image_size):
+                st.image(uploaded_file, caption="업로드한 이미지")
+            else:
+                st.warning(f"한 번의 대화에서 올릴 수 있는 이미지는 모두 합쳐 {SESSION_BLOB_BYTES // (1024 * 1024)}MB까지입니다. 이 이미지는 첨부되지 않습니다.")
+                image_url = None
+        else:
+            st.warning("지원하지 않는 파일 형식입니다.")
+
+    pending_content = None
+
+    # Form submit 처리
+    if submit_button and (user_input.strip() or uploaded_file):
+        # 콘텐츠 구성
+        if image_url:
+            # 이미지가 있는 경우 멀티모달 형식 (세션에는 blob 참조만 보관)
+            content = []
+            if user_input.strip():
+                content.append({"type": "text", "text": user_input})
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": image_url, "detail": image_detail}
+            })
+        elif user_input.strip():
+            # 텍스트만 있는 경우
+            content = user_input
+        else:
+            st.warning("텍스트나 이미지를 입력해주세요.")
+            return
+
+        pending_content = content
+
+    # 최근 대화 표시
+    st.subheader("📌 최근 대화")
+    if pending_content is not None:
+        # 새 질문은 최근 대화 영역에서 바로 스트리밍으로 응답
+        st.write("**You:**")
+        display_content(pending_content)
+        st.write(f"**{stage.assistant_name}:**")
+        response = get_chatgpt_response(pending_content, extracted_pdf_text, placeholder=st.empty())
+
+        if response:
+            st.session_state["history_page"] = 0
+            st.rerun()  # 응답 후 누적 대화 목록까지 새로고침
+    elif st.session_state["recent_message"]["user"] or st.session_state["recent_message"]["assistant"]:
+        # 사용자 메시지 표시
+        if st.session_state["recent_message"]["user"]:
+            st.write("**You:**")
+            display_content(st.session_state["recent_message"]["user"])
+        
+        # 어시스턴트 메시지 표시
+        if st.session_state["recent_message"]["assistant"]:
+            st.write(f"**{stage.assistant_name}:**")
+            st.write(st.session_state["recent_message"]["assistant"])
+    else:
+        st.write("아직 최근 대화가 없습니다.")
+
+
+# 누적 대화 목록의 페이지 이동 (버튼 콜백, 클릭으로 fragment만 다시 실행됨)
+def set_history_page(page):
+    st.session_state["history_page"] = page
+
+# Earlier turns, one page at a time (newest page first); paging reruns only this fragment
+@st.fragment
+def history_panel(stage):
+    st.subheader("📜 누적 대화 목록")
+    messages = st.session_state["messages"]
+    turns = [messages[i:i + 2] for i in range(0, len(messages), 2)]
+    if st.session_state["recent_message"]["assistant"]:
+        turns = turns[:-1]  # 마지막 질문/답변은 최근 대화에 이미 표시됨
+    if not turns:
+        st.write("아직 대화 기록이 없습니다.")
+        return
+
+    page_count = (len(turns) + HISTORY_PAGE_TURNS - 1) // HISTORY_PAGE_TURNS
+    page = min(st.session_state.get("history_page", 0), page_count - 1)  # 0이 가장 최근 페이지
+    end = len(turns) - page * HISTORY_PAGE_TURNS
+    start = max(0, end - HISTORY_PAGE_TURNS)
+
+    with timed("history_render", stage=stage.key):
+        for number in range(start, end):
+            question = message_text(turns[number][0]["content"])
+            title = f"{number + 1}. {question[:40]}{'…' if len(question) > 40 else ''}"
+            # 지난 페이지의 대화는 접어서 표시
+            with st.expander(title, expanded=page == 0):
+                for message in turns[number]:
+                    if message["role"] == "user":
+                        st.write("**You:**")
+                        display_content(message["content"])
+                    elif message["role"] == "assistant":
+                        st.write(f"**{stage.assistant_name}:**")
+                        st.write(message["content"])
+
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            st.button("◀ 이전 대화", disabled=page == page_count - 1, on_click=set_history_page, args=(page + 1,))
+        with col2:
+            st.button("최근 대화 ▶", disabled=page == 0, on_click=set_history_page, args=(page - 1,))
+        with col3:
+            st.caption(f"{page_count - page} / {page_count} 페이지")
+
+
+# Page 4: Save and summarize
+def page_4():
+    stage = current_stage()
+    st.title(f"{stage.helper_name}의 제안")
+    st.write(f"{stage.helper_name}가 대화 내용을 정리 중입니다. 잠시만 기다려주세요.")
+    
+    # 페이지 4로 돌아올 때마다 피드백 준비 (대화가 바뀌지 않았으면 이전 결과를 재사용)
+    if not st.session_state.get("feedback_saved", False):
+        try:
+            # 대화 기록을 기반으로 탐구 계획 작성 (이미지는 base64 대신 짧은 표시로 대체)
+            prompt = summary_prompt(stage, build_transcript(st.session_state["messages"]))
+            
+            # 같은 프롬프트로 이미 만든 피드백이 있으면 OpenAI를 다시 호출하지 않음
+            digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+            cached_plan = st.session_state.get("plan_cache", {})
+            if cached_plan.get("digest") == digest:
+                st.session_state["experiment_plan"] = cached_plan["plan"]
+            else:
+                # OpenAI API 호출 (요청이 몰리면 순서를 기다림)
+                messages = [{"role": "system", "content": prompt}]
+                waiting = st.empty()
+                timing = {}
+                response = schedule_openai(
+                    lambda choice: openai_client(choice).chat.completions.create(
+                        model=choice.model,
+                        messages=messages
+                    ),
+                    messages,
+                    placeholder=waiting,
+                    call="feedback",
+                    timing=timing
+                )
+                waiting.empty()
+                record_usage(response.usage, timing)
+                st.session_state["experiment_plan"] = response.choices[0].message.content
+                st.session_state["plan_cache"] = {"digest": digest, "plan": st.session_state["experiment_plan"]}
+            
+        except Exception as e:
+            st.error(f"피드백 생성 중 오류가 발생했습니다: {e}")
+            st.session_state["experiment_plan"] = "피드백을 생성할 수 없습니다."
+
+    # 피드백 출력
+    st.subheader("📋 생성된 피드백")
+    st.write(st.session_state["experiment_plan"])
+
+    # 대화 내용과 피드백을 통합하여 데이터베이스에 저장
+    if not st.session_state.get("feedback_saved", False):
+        all_data_to_store = st.session_state["messages"] + [{"role": "assistant", "content": st.session_state["experiment_plan"]}]
+        
+        # MySQL에 저장
+        with timed("db_save", stage=stage.key):
+            saved = save_to_db(all_data_to_store)
+        if saved:
+            st.session_state["feedback_saved"] = True  # 저장 성공 시 플래그 설정
+            st.success("데이터가 성공적으로 저장되었습니다.")
+        else:
+            st.error("저장에 실패했습니다. 다시 시도해주세요.")
+
+    # 이전 버튼 (페이지 3으로 이동 시 피드백 삭제)
+    if st.button("이전"):
+        st.session_state["step"] = 3
+        if "experiment_plan" in st.session_state:
+            del st.session_state["experiment_plan"]  # 피드백 삭제
+        st.session_state["feedback_saved"] = False  # 피드백 재생성 플래그 초기화
+        st.rerun()
+
+    # 처음으로 돌아가기 버튼
+    if st.button("처음으로"):
+        # 세션 초기화
+        for key in list(st.session_state.keys()):
+            del st.session_state[key]
+        st.rerun()
+
+# Main logic
+def run(stage_key):
+    stage = get_stage(stage_key)
+
+    # app 제목 표시
+    st.set_page_config(
+        page_title=stage.page_title,  # 원하는 제목
+        page_icon="🔬",  # 선택사항: 이모지나 favicon
+        layout="wide",   # 선택사항: "centered" 또는 "wide"
+        initial_sidebar_state="expanded"  # 선택사항
+    )
+
+    # 같은 브라우저 세션에서 단계가 바뀌면 다른 단계의 대화가 섞이지 않도록 초기화
+    if st.session_state.get("stage_key") != stage.key:
+        for key in list(st.session_state.keys()):
+            del st.session_state[key]
+        st.session_state["stage_key"] = stage.key
+
+    if "step" not in st.session_state:
+        st.session_state["step"] = 1
+
+    # METRICS_PORT가 설정되어 있으면 /metrics (Prometheus 형식) 제공
+    try:
+        serve_metrics()
+    except OSError as e:
+        logger.warning("metrics endpoint not started: %s", e)
+
+    # 세션별 메모리 사용량 집계 (/metrics)
+    session_memory.update(
+        st.session_state.setdefault("session_key", uuid.uuid4().hex),
+        estimate_bytes({key: st.session_state[key] for key in st.session_state}),
+        sum(st.session_state.get("session_blobs", {}).values())
+    )
+
+    # 페이지 한 번을 그리는 시간 (st.rerun으로 중단되어도 기록됨)
+    with timed("rerun", stage=stage.key, step=st.session_state["step"]):
+        if st.session_state["step"] == 1:
+            page_1()
+        elif st.session_state["step"] == 2:
+            page_2()
+        elif st.session_state["step"] == 3:
+            page_3()
+        elif st.session_state["step"] == 4:
+            page_4()
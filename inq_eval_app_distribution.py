@@ -1,86 +1,332 @@
 import streamlit as st
 import pymysql
+import hmac
 import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from inq_batch import load_results
+from inq_db import build_filters, ensure_index, get_pool
+from inq_export import EXPORT_FORMATS, export
+from inq_metrics import ensure_metrics_table, stage_summary
+from inq_rubric import CRITERIA_COLUMNS, class_totals, ensure_rubric_tables, students_missing
+from inq_schema import LEGACY, NORMALIZED, load_messages, prepare_schema, storage_layout
+from inq_search import SEARCH_LIMIT, SYNC_INTERVAL, ensure_legacy_search_table, query_terms, search_messages, snippet, start_legacy_sync
+from inq_stages import STAGES
 
 # OpenAI API 키 설정
 OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
 
-# MySQL 연결 함수
-def connect_to_db():
-    return pymysql.connect(
-        host=st.secrets["DB_HOST"],
-        user=st.secrets["DB_USER"],
-        password=st.secrets["DB_PASSWORD"],
-        database=st.secrets["DB_DATABASE"],
-        charset='utf8mb4'
-    )
-
-# 모든 레코드 가져오기 함수
-def fetch_records():
+PAGE_SIZE = 50  # 한 페이지에 보여줄 내역 수
+DEFAULT_CLASS = str(st.secrets.get("DEFAULT_CLASS", ""))  # 기본으로 보여줄 반 (예: "103")
+USE_NORMALIZED = storage_layout() == NORMALIZED
+RECORD_TABLE = "inq_sessions" if USE_NORMALIZED else "qna"  # 두 테이블 모두 id, number, name, time 컬럼을 가짐
+EXPORT_DIR = st.secrets.get("EXPORT_DIR", tempfile.gettempdir())  # 내보낸 파일을 저장할 서버 경로
+VERSION_TTL = 5  # 새 제출이 있는지 확인하는 간격(초)
+RECORDS_TTL = 300  # 목록 조회 결과를 재사용하는 최대 시간(초), 그 전에도 새 제출이 있으면 다시 조회
+CONVERSATION_CACHE_ENTRIES = 64  # 파싱한 대화 기록을 보관할 최대 개수 (오래 안 본 것부터 제거)
+
+# 목록 조회에 쓰는 인덱스 생성 (프로세스당 한 번, 실패하면 캐시되지 않으므로 다음 rerun에서 다시 시도)
+@st.cache_resource
+def prepare_indexes():
+    if USE_NORMALIZED:
+        prepare_schema()  # inq_sessions는 테이블 정의에 인덱스가 포함됨
+        # 검색 색인은 테이블 정의와 분리해 여기서 만듦 (ngram 파서를 쓸 수 없는 서버에서도 대화 저장은 되도록)
+        ensure_index("inq_messages", "ft_messages_text", "text", fulltext=True)
+    else:
+        ensure_index("qna", "idx_qna_number_id", "number, id")
+        ensure_index("qna", "idx_qna_time_id", "time, id")
+        with get_pool().connection() as db:
+            with db.cursor() as cursor:
+                ensure_legacy_search_table(cursor)  # 내용은 start_search_sync의 백그라운드 스레드가 채움
+
+# Contents of an exported file, read only when the download is clicked
+def read_export(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+# 새 제출이나 대화 갱신이 있으면 바뀌는 값 (모두 인덱스만 읽는 가벼운 조회, 몇 초 동안 재사용)
+@st.cache_data(ttl=VERSION_TTL, show_spinner=False)
+def data_version():
+    with get_pool().connection() as db:
+        with db.cursor() as cursor:
+            # 정규화된 저장 방식은 대화가 이어질 때마다 세션의 time이 갱신됨
+            cursor.execute(f"SELECT MAX(id), COUNT(*), MAX(time) FROM {RECORD_TABLE}")
+            return cursor.fetchone()
+
+# version이 바뀌면 캐시 키가 달라져 다시 조회
+@st.cache_data(ttl=RECORDS_TTL, show_spinner=False)
+def _query_records(conditions, params, page_size, version):
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT id, number, name, time 
+    FROM {RECORD_TABLE}
+    {where}
+    ORDER BY number, id
+    LIMIT %s
+    """
+    with get_pool().connection() as db:
+        with db.cursor() as cursor:
+            cursor.execute(query, params + [page_size + 1])
+            return cursor.fetchall()
+
+# 레코드 한 페이지 가져오기 함수 (number, id 기준 keyset 페이지네이션)
+def fetch_records(conditions, params, after=None, page_size=PAGE_SIZE):
+    conditions = list(conditions)
+    params = list(params)
+    if after is not None:
+        conditions.append("(number > %s OR (number = %s AND id > %s))")
+        params.extend([after[0], after[0], after[1]])
     try:
-        db = connect_to_db()
-        cursor = db.cursor()
-        query = """
-        SELECT id, number, name, time 
-        FROM qna
-        ORDER BY
-          CASE WHEN number >= 10300 AND number < 10400 THEN 0 ELSE 1 END,
-          number
-        """
-        cursor.execute(query)
-        records = cursor.fetchall()
-        cursor.close()
-        db.close()
-        return records
+        records = _query_records(conditions, params, page_size, data_version())
+        # 한 건 더 가져와 다음 페이지가 있는지 판단
+        return records[:page_size], len(records) > page_size
     except pymysql.MySQLError as e:
         st.error(f"데이터베이스 오류: {e}")
-        return []
+        return [], False
+
+# 파싱한 대화 기록 (기록 id와 마지막 갱신 시각별로 보관, 최근에 본 것부터 최대 CONVERSATION_CACHE_ENTRIES개)
+@st.cache_resource(max_entries=CONVERSATION_CACHE_ENTRIES, show_spinner=False)
+def _load_conversation(record_id, updated):
+    with get_pool().connection() as db:
+        with db.cursor() as cursor:
+            if USE_NORMALIZED:
+                return load_messages(cursor, record_id)
+            cursor.execute("SELECT chat FROM qna WHERE id = %s", (record_id,))
+            record = cursor.fetchone()
+    return json.loads(record[0]) if record and record[0] else None
+
+# 일괄 작업(inq_batch.py)으로 만든 요약과 채점 결과 ({task: result}, 아직 실행하지 않았으면 빈 dict)
+def fetch_batch_results(record_id):
+    try:
+        with get_pool().connection() as db:
+            with db.cursor() as cursor:
+                return load_results(cursor, NORMALIZED if USE_NORMALIZED else LEGACY, record_id)
+    except pymysql.MySQLError:
+        return {}
 
-# 특정 ID의 레코드 가져오기 함수
-def fetch_record_by_id(record_id):
+# 특정 ID의 대화 기록 가져오기 함수 (저장 방식에 관계없이 메시지 목록을 반환)
+def fetch_record_by_id(record_id, updated=None):
     try:
-        db = connect_to_db()
-        cursor = db.cursor()
-        cursor.execute("SELECT chat FROM qna WHERE id = %s", (record_id,))
-        record = cursor.fetchone()
-        cursor.close()
-        db.close()
-        return record
+        return _load_conversation(record_id, updated)
     except pymysql.MySQLError as e:
         st.error(f"데이터베이스 오류: {e}")
         return None
 
+# 레거시 저장 방식: 새로 저장된 qna 행을 백그라운드 스레드가 주기적으로 검색 색인에 반영 (프로세스당 한 번)
+@st.cache_resource
+def start_search_sync():
+    return start_legacy_sync(get_pool())
+
+# 대화 내용 검색 (레거시 저장 방식은 색인에 반영된 기록만 검색됨)
+def search_conversations(terms, conditions, params, stage=None):
+    try:
+        with get_pool().connection() as db:
+            with db.cursor() as cursor:
+                return search_messages(cursor, terms, conditions, params, USE_NORMALIZED, stage=stage)
+    except pymysql.MySQLError as e:
+        st.error(f"데이터베이스 오류: {e}")
+        return []
+
+# 최근 며칠간의 단계별 응답 시간/토큰 요약
+def fetch_stage_summary(days=7):
+    try:
+        with get_pool().connection() as db:
+            with db.cursor() as cursor:
+                ensure_metrics_table(cursor)
+                return stage_summary(cursor, datetime.now() - timedelta(days=days))
+    except pymysql.MySQLError as e:
+        st.error(f"데이터베이스 오류: {e}")
+        return []
+
+# 반별 채점 기준 충족 수 (저장할 때마다 갱신되는 합계 테이블에서 한 번에 조회)
+def fetch_class_totals(stage_key, class_prefix):
+    try:
+        with get_pool().connection() as db:
+            with db.cursor() as cursor:
+                ensure_rubric_tables(cursor)
+                return class_totals(cursor, stage_key, class_prefix)
+    except pymysql.MySQLError as e:
+        st.error(f"데이터베이스 오류: {e}")
+        return []
+
+def fetch_students_missing(stage_key, class_prefix, column):
+    try:
+        with get_pool().connection() as db:
+            with db.cursor() as cursor:
+                return students_missing(cursor, stage_key, class_prefix, column)
+    except pymysql.MySQLError as e:
+        st.error(f"데이터베이스 오류: {e}")
+        return []
+
 # Streamlit 애플리케이션
 st.title("학생의 인공지능 사용 내역(교사용)")
 
-# 비밀번호 입력
-password = st.text_input("비밀번호를 입력하세요", type="password")
+# 비밀번호 입력 (한 번 맞으면 이 세션에서는 다시 묻지 않음)
+if not st.session_state.get("authenticated"):
+    password = st.text_input("비밀번호를 입력하세요", type="password")
+    if password and hmac.compare_digest(password.encode("utf-8"), str(st.secrets["PASSWORD"]).encode("utf-8")):  # 환경 변수에 저장된 비밀번호와 비교
+        st.session_state["authenticated"] = True
+        st.rerun()
+
+if st.session_state.get("authenticated"):
+    try:
+        prepare_indexes()
+    except pymysql.MySQLError as e:
+        st.warning(f"인덱스를 만들지 못했습니다: {e}")
+    if not USE_NORMALIZED:
+        start_search_sync()
+
+    # 단계별 응답 지표 (켰을 때만 조회)
+    if st.toggle("📈 최근 7일 응답 지표 보기"):
+        summary = fetch_stage_summary()
+        if summary:
+            st.dataframe(summary, hide_index=True)
+        else:
+            st.write("기록된 지표가 없습니다.")
+
+    # 검색 조건
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        class_prefix = st.text_input("반 (예: 103)", value=DEFAULT_CLASS).strip()
+    with col2:
+        student_number = st.text_input("학번").strip()
+    with col3:
+        date_range = st.date_input("기간", value=())
+
+    if class_prefix and not class_prefix.isdigit():
+        st.error("반은 숫자로 입력하세요 (예: 103).")
+        st.stop()
+    date_range = tuple(date_range) if len(date_range) == 2 else None
+    conditions, params = build_filters(class_prefix, student_number, date_range)
+
+    # 채점 기준별 충족 비율 (학생의 첫 제출을 평가할 때와 일괄 채점 때 기록된 점수, 위의 반 조건 적용)
+    if st.toggle("📊 채점 기준별 분포 보기"):
+        rubric_stage = st.selectbox("채점 단계", list(STAGES), format_func=lambda key: STAGES[key].page_title)
+        rubric = STAGES[rubric_stage].rubric
+        totals = fetch_class_totals(rubric_stage, class_prefix)
+        if totals:
+            table = {"채점 기준": list(rubric)}
+            for prefix, sessions, counts in totals:
+                table[f"{prefix}반 ({sessions}명)"] = [f"{count / sessions:.0%}" for count in counts]
+            st.dataframe(table, hide_index=True)
+            if class_prefix:
+                column = st.selectbox("기준을 충족하지 못한 학생", CRITERIA_COLUMNS, format_func=lambda c: rubric[CRITERIA_COLUMNS.index(c)])
+                missing = fetch_students_missing(rubric_stage, class_prefix, column)
+                st.write(", ".join(number for number, _ in missing) if missing else "없음")
+        else:
+            st.write("채점된 기록이 없습니다.")
+
+    # 대화 내용 검색 (위의 반/학번/기간 조건을 함께 적용)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        search_query = st.text_input("🔍 대화 내용 검색 (예: 삼투압)").strip()
+    with col2:
+        # 단계는 정규화된 저장 방식에서만 기록됨
+        stage_labels = {"": "전체 단계", **{key: stage.page_title for key, stage in STAGES.items()}}
+        search_stage = st.selectbox("단계", list(stage_labels), format_func=stage_labels.get, disabled=not USE_NORMALIZED)
+    if search_query:
+        terms = [term for term in query_terms(search_query) if len(term) >= 2]
+        if not terms:
+            st.warning("두 글자 이상의 검색어를 입력하세요.")
+        else:
+            matches = search_conversations(terms, conditions, params, stage=search_stage or None)
+            st.caption(f"일치하는 메시지 {len(matches)}건" + (" (상위 결과만 표시)" if len(matches) >= SEARCH_LIMIT else ""))
+            if not USE_NORMALIZED:
+                st.caption(f"방금 저장된 기록은 {SYNC_INTERVAL}초 안에 검색 색인에 반영됩니다.")
+            sessions = {}
+            for record_id, number, name, time, stage_key, turn_index, role, text in matches:
+                sessions.setdefault((record_id, number, name, time, stage_key), []).append((turn_index, role, text))
+            for (record_id, number, name, time, stage_key), hits in sessions.items():
+                stage_title = f" · {stage_labels.get(stage_key, stage_key)}" if stage_key else ""
+                with st.expander(f"{number} ({name}) - {time}{stage_title} · {len(hits)}건"):
+                    for turn_index, role, text in sorted(hits):
+                        speaker = "학생" if role == "user" else "챗봇"
+                        st.markdown(f"- **{speaker}**: {snippet(text, terms)}")
+
+    # 조건에 맞는 대화 전체를 파일로 내보내기 (켰을 때만 표시)
+    if st.toggle("📦 조건에 맞는 대화 내보내기"):
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            export_format = st.selectbox("형식", EXPORT_FORMATS)
+        with col2:
+            export_images = st.checkbox("이미지 포함", value=False)
+        with col3:
+            if st.button("파일 만들기"):
+                path = os.path.join(EXPORT_DIR, f"inq_export_{datetime.now():%Y%m%d_%H%M%S}.{export_format}")
+                progress = st.empty()
+                try:
+                    # 서버 측 커서로 한 행씩 읽어 바로 파일에 쓰므로 대화가 많아도 메모리 사용량이 일정함
+                    export(
+                        export_format, path, conditions, params, USE_NORMALIZED, get_pool().connection,
+                        include_images=export_images,
+                        progress=lambda count: progress.caption(f"{count}개 세션 기록 중...")
+                    )
+                    progress.empty()
+                    st.session_state["export_path"] = path
+                except (pymysql.MySQLError, RuntimeError, OSError) as e:
+                    st.error(f"내보내기에 실패했습니다: {e}")
+        export_path = st.session_state.get("export_path")
+        if export_path and os.path.exists(export_path):
+            size = os.path.getsize(export_path)
+            # 파일은 내려받기를 누를 때만 읽음 (검색어 입력 등으로 rerun될 때마다 읽지 않음)
+            st.download_button(
+                f"내려받기 ({size / 1024 / 1024:.1f}MB)", lambda: read_export(export_path),
+                file_name=os.path.basename(export_path), on_click="ignore"
+            )
+            st.caption(f"서버 경로: {export_path}")
+
+    # 조건이 바뀌면 첫 페이지로 (page_cursors: 각 페이지를 시작할 때 기준이 되는 (number, id))
+    filter_key = (class_prefix, student_number, date_range)
+    if st.session_state.get("filter_key") != filter_key:
+        st.session_state["filter_key"] = filter_key
+        st.session_state["page_cursors"] = [None]
+    cursors = st.session_state["page_cursors"]
 
-if password == st.secrets["PASSWORD"]:  # 환경 변수에 저장된 비밀번호와 비교
     # 저장된 레코드 불러오기
-    records = fetch_records()
+    records, has_next = fetch_records(conditions, params, after=cursors[-1])
 
     if records:
-        # 레코드 선택
-        record_options = [f"{record[1]} ({record[2]}) - {record[3]}" for record in records]
-        selected_record = st.selectbox("내역을 선택하세요:", record_options)
+        # 레코드 선택 (id로 선택하고 표시 문자열은 dict에서 조회)
+        record_labels = {record[0]: f"{record[1]} ({record[2]}) - {record[3]}" for record in records}
+        record_times = {record[0]: record[3] for record in records}
+        selected_record_id = st.selectbox("내역을 선택하세요:", list(record_labels), format_func=record_labels.get)
 
-        # 선택된 레코드 ID 추출
-        selected_record_id = records[record_options.index(selected_record)][0]
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            if st.button("이전 페이지", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if st.button("다음 페이지", disabled=not has_next):
+                cursors.append((records[-1][1], records[-1][0]))
+                st.rerun()
+        with col3:
+            st.caption(f"{len(cursors)} 페이지")
 
         # 선택된 학생의 대화 기록 불러오기
-        record = fetch_record_by_id(selected_record_id)
-        if record and record[0]:  # 대화 기록이 있는지 확인
-            try:
-                chat = json.loads(record[0])  # JSON 디코딩
-                st.write("### 학생의 대화 기록")
-                for message in chat:
-                    if message["role"] == "user":
-                        st.write(f"**You:** {message['content']}")
-                    elif message["role"] == "assistant":
-                        st.write(f"**과학탐구 도우미:** {message['content']}")
-            except json.JSONDecodeError:
-                st.error("대화 기록을 불러오는 데 실패했습니다. JSON 형식이 잘못되었습니다.")
+        try:
+            chat = fetch_record_by_id(selected_record_id, record_times[selected_record_id])
+        except json.JSONDecodeError:
+            st.error("대화 기록을 불러오는 데 실패했습니다. JSON 형식이 잘못되었습니다.")
+            st.stop()
+        if chat:  # 대화 기록이 있는지 확인
+            st.write("### 학생의 대화 기록")
+            for message in chat:
+                if message["role"] == "user":
+                    st.write(f"**You:** {message['content']}")
+                elif message["role"] == "assistant":
+                    st.write(f"**과학탐구 도우미:** {message['content']}")
+
+            batch_results = fetch_batch_results(selected_record_id)
+            if batch_results:
+                st.write("### 일괄 채점 결과")
+                if "rubric" in batch_results:
+                    with st.expander("채점 기준별 평가", expanded=True):
+                        st.write(batch_results["rubric"])
+                if "summary" in batch_results:
+                    with st.expander("요약과 피드백"):
+                        st.write(batch_results["summary"])
         else:
             st.warning("선택된 레코드에 대화 기록이 없습니다.")
     else:
@@ -0,0 +1,178 @@
+# Streaming bulk export of stored conversations to JSONL, CSV or Parquet
+#
+# 사용법: python inq_export.py --format jsonl --out export.jsonl [--class 103] [--since 2024-03-01] [--until 2024-07-31] [--no-images]
+# 서버 측 커서(SSCursor)로 한 행씩 읽어 바로 기록하므로 테이블 크기와 관계없이 메모리 사용량이 일정합니다.
+# --out - 이면 JSONL/CSV를 표준 출력으로 씁니다.
+import argparse
+import csv
+import json
+import sys
+from contextlib import closing, contextmanager
+from datetime import date
+from itertools import groupby
+
+import pymysql
+
+from inq_context import message_text
+from inq_db import build_filters, connect_from_secrets
+from inq_schema import NORMALIZED, load_images, message_content, storage_layout
+
+EXPORT_FORMATS = ("jsonl", "csv", "parquet")
+PARQUET_BATCH_ROWS = 1000   # Parquet row group 하나에 모아 쓰는 메시지 수
+PROGRESS_EVERY = 100        # 진행 상황을 알리는 세션 간격
+CSV_COLUMNS = ["record_id", "number", "name", "time", "stage", "turn_index", "role", "kind", "text", "images"]
+
+
+def _strip_images(content):
+    return content if isinstance(content, str) else message_text(content)
+
+
+# Sessions as dicts with their messages, read one row at a time from a server-side cursor
+def iter_sessions(cursor, conditions, params, normalized, include_images=True, image_cursor=None):
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if not normalized:
+        cursor.execute(f"SELECT id, number, name, time, chat FROM qna {where} ORDER BY id", params)
+        for record_id, number, name, time, chat in cursor:
+            try:
+                messages = json.loads(chat) if chat else []
+            except json.JSONDecodeError:
+                continue
+            messages = [m for m in messages if isinstance(m, dict) and "content" in m]
+            if not include_images:
+                messages = [{**m, "content": _strip_images(m["content"])} for m in messages]
+            yield {"id": record_id, "number": number, "name": name, "time": time, "stage": None, "messages": messages}
+        return
+
+    cursor.execute(
+        f"""
+        SELECT s.id, s.number, s.name, s.time, s.stage, m.turn_index, m.role, m.kind, m.text
+        FROM inq_sessions s JOIN inq_messages m ON m.session_key = s.session_key
+        {where}
+        ORDER BY s.id, m.turn_index < 0, m.turn_index
+        """,
+        params
+    )
+    # 한 세션의 메시지만 모아서 내보냄 (요약은 마지막)
+    for (record_id, number, name, time, stage), rows in groupby(cursor, key=lambda row: row[:5]):
+        # 서버 측 커서가 열려 있는 동안에는 같은 연결을 쓸 수 없으므로 이미지는 다른 연결로 조회
+        images = load_images(image_cursor, record_id) if include_images and image_cursor is not None else {}
+        messages = [
+            {"role": role, "kind": kind, "content": message_content(text, images.get(turn_index))}
+            for _, _, _, _, _, turn_index, role, kind, text in rows
+        ]
+        yield {"id": record_id, "number": number, "name": name, "time": time, "stage": stage, "messages": messages}
+
+
+# One flat row per message (CSV/Parquet); image data URLs go into the images column
+def message_rows(session):
+    for turn_index, message in enumerate(session["messages"]):
+        content = message["content"]
+        images = []
+        if not isinstance(content, str):
+            parts = content if isinstance(content, list) else [content]
+            images = [p["image_url"]["url"] for p in parts if isinstance(p, dict) and p.get("type") == "image_url"]
+        yield {
+            "record_id": session["id"],
+            "number": session["number"],
+            "name": session["name"],
+            "time": str(session["time"]),
+            "stage": session["stage"],
+            "turn_index": turn_index,
+            "role": message.get("role"),
+            "kind": message.get("kind", "chat"),
+            "text": message_text(content, image_placeholder=""),
+            "images": "\n".join(images),
+        }
+
+
+def _counted(sessions, progress):
+    count = 0
+    for session in sessions:
+        yield session
+        count += 1
+        if progress is not None and count % PROGRESS_EVERY == 0:
+            progress(count)
+    if progress is not None:
+        progress(count)
+
+
+def write_jsonl(sessions, f):
+    for session in sessions:
+        f.write(json.dumps({**session, "time": str(session["time"])}, ensure_ascii=False))
+        f.write("\n")
+
+
+def write_csv(sessions, f):
+    writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for session in sessions:
+        writer.writerows(message_rows(session))
+
+
+def write_parquet(sessions, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet로 내보내려면 pyarrow를 설치해야 합니다 (pip install pyarrow).")
+
+    schema = pa.schema([
+        ("record_id", pa.int64()), ("number", pa.string()), ("name", pa.string()), ("time", pa.string()),
+        ("stage", pa.string()), ("turn_index", pa.int32()), ("role", pa.string()), ("kind", pa.string()),
+        ("text", pa.string()), ("images", pa.string()),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for session in sessions:
+            batch.extend(message_rows(session))
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+# Export matching sessions to `path` ("-" = stdout for jsonl/csv); `connect()` yields a DB connection
+def export(fmt, path, conditions, params, normalized, connect, include_images=True, progress=None):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"지원하지 않는 형식입니다: {fmt}")
+    with connect() as db, (connect() if normalized and include_images else _no_connection()) as image_db:
+        with db.cursor(pymysql.cursors.SSCursor) as cursor:
+            image_cursor = image_db.cursor() if image_db is not None else None
+            try:
+                sessions = _counted(iter_sessions(cursor, conditions, params, normalized, include_images, image_cursor), progress)
+                if fmt == "parquet":
+                    write_parquet(sessions, path)
+                elif path == "-":
+                    (write_jsonl if fmt == "jsonl" else write_csv)(sessions, sys.stdout)
+                else:
+                    with open(path, "w", encoding="utf-8", newline="") as f:
+                        (write_jsonl if fmt == "jsonl" else write_csv)(sessions, f)
+            finally:
+                if image_cursor is not None:
+                    image_cursor.close()
+
+
+@contextmanager
+def _no_connection():
+    yield None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="저장된 대화 기록을 파일로 내보냅니다.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+    parser.add_argument("--out", required=True, help="출력 파일 경로 (JSONL/CSV는 - 이면 표준 출력)")
+    parser.add_argument("--class", dest="class_prefix", default="", help="반 (예: 103)")
+    parser.add_argument("--since", type=date.fromisoformat, help="시작 날짜 (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="끝 날짜 (YYYY-MM-DD, 포함)")
+    parser.add_argument("--no-images", action="store_true", help="이미지를 빼고 텍스트만 내보냄")
+    args = parser.parse_args()
+
+    date_range = (args.since or date(2000, 1, 1), args.until or date.today()) if args.since or args.until else None
+    conditions, params = build_filters(args.class_prefix, "", date_range)
+    export(
+        args.format, args.out, conditions, params, storage_layout() == NORMALIZED,
+        lambda: closing(connect_from_secrets()),
+        include_images=not args.no_images,
+        progress=lambda count: print(f"~ {count}개 세션", file=sys.stderr)
+    )
@@ -0,0 +1,76 @@
+# Image preprocessing before upload to the vision model
+import io
+
+import streamlit as st
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# 기본값 (secrets의 IMAGE_MAX_SIDE, IMAGE_FORMAT으로 바꿀 수 있음, image_settings 참고)
+IMAGE_MAX_SIDE = 1536  # 긴 변 최대 픽셀 (gpt-4o high detail은 짧은 변을 768로 줄이므로 이 이상은 낭비)
+IMAGE_FORMAT = "JPEG"  # "JPEG" 또는 "WEBP"
+IMAGE_QUALITY = 80
+LOW_DETAIL_MAX_SIDE = 512  # 이 크기 이하는 detail=low(85토큰)로 충분
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+
+def _to_rgb(image):
+    # JPEG은 투명도를 지원하지 않으므로 흰 배경 위에 합성
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+# (max_side, format) from secrets, read on first use rather than at import
+@st.cache_resource
+def image_settings():
+    return (
+        int(st.secrets.get("IMAGE_MAX_SIDE", IMAGE_MAX_SIDE)),
+        str(st.secrets.get("IMAGE_FORMAT", IMAGE_FORMAT)).upper()
+    )
+
+
+def choose_detail(width, height):
+    return "low" if max(width, height) <= LOW_DETAIL_MAX_SIDE else "high"
+
+
+# Rotate, downscale and recompress; returns (bytes, mime_type, detail)
+def preprocess_image(data, max_side=IMAGE_MAX_SIDE, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY, fallback_mime="image/png"):
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_format = image.format
+        orientation = image.getexif().get(0x0112, 1)  # EXIF Orientation
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError):
+        # PIL이 읽지 못하는 형식은 원본 그대로 전송
+        return data, fallback_mime, "high"
+
+    resized = max(image.size) > max_side
+    if resized:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    output = io.BytesIO()
+    if fmt == "WEBP":
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(output, format="WEBP", quality=quality, method=4)
+    else:
+        fmt = "JPEG"
+        _to_rgb(image).save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+    processed = output.getvalue()
+    detail = choose_detail(*image.size)
+
+    # 이미 작은 이미지는 재압축해도 커질 수 있으므로 원본을 그대로 사용
+    unchanged = not resized and orientation == 1
+    if unchanged and len(processed) >= len(data) and original_format in MIME_TYPES:
+        return data, MIME_TYPES[original_format], detail
+    return processed, MIME_TYPES[fmt], detail
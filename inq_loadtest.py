@@ -0,0 +1,380 @@
+# Offline load test: N simulated students drive page_1 → page_4 against a mock OpenAI server
+#
+# 사용법: python inq_loadtest.py --students 30 --turns 3 [--stage design] [--layout legacy]
+#   - OpenAI 대신 이 스크립트가 띄우는 로컬 서버(OpenAI 호환, 스트리밍 지원)에 요청합니다.
+#   - DB는 로컬 MySQL(예: docker run -e MYSQL_ROOT_PASSWORD=root -e MYSQL_DATABASE=inq_load -p 3306:3306 mysql:8)을 씁니다.
+#     운영 DB를 가리키지 마세요. 레거시 저장 방식이면 qna 테이블을 만들어 둡니다.
+#   - 외부 네트워크 없이 실행됩니다.
+#   - python inq_loadtest.py --serve-mock 으로 모의 서버만 띄워 앱을 직접 실행해 볼 수도 있습니다.
+import argparse
+import json
+import os
+import pickle
+import random
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from inq_metrics import percentile
+
+ENTRY_POINTS = {"design": "inq_model01_distribution.py", "analysis": "inq_model02_distribution.py"}
+SAMPLE_QUESTIONS = [
+    "제 가설은 '온도가 높을수록 설탕이 물에 빨리 녹는다'입니다. 가설이 적절한가요?",
+    "독립 변인과 종속 변인을 어떻게 정하면 좋을까요?",
+    "통제 변인으로 무엇을 더 고려해야 하나요?",
+    "실험을 몇 번 반복해야 오차를 줄일 수 있을까요?",
+    "측정 도구로 초시계를 쓰려고 하는데 괜찮을까요?",
+]
+LEGACY_TABLE = """
+    CREATE TABLE IF NOT EXISTS qna (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        number VARCHAR(16) NOT NULL,
+        name VARCHAR(64) NOT NULL,
+        chat LONGTEXT NOT NULL,
+        time DATETIME NOT NULL
+    ) DEFAULT CHARSET=utf8mb4
+"""
+
+
+# Sample value matching a JSON schema (구조화된 출력 요청에 대한 모의 응답)
+def mock_value(schema):
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: mock_value(value) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [mock_value(schema.get("items", {}))]
+    if kind == "boolean":
+        return random.random() < 0.5
+    if kind in ("integer", "number"):
+        return 0
+    return "모의 응답입니다."
+
+
+# Minimal OpenAI-compatible /chat/completions endpoint with configurable latency
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    first_token_latency = 0.5
+    token_delay = 0.02
+    response_tokens = 150
+    rate_limit_ratio = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        if random.random() < self.rate_limit_ratio:
+            self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit_exceeded"}}, {"retry-after-ms": "500"})
+            return
+
+        # 토큰 수는 앱과 같은 방식(바이트/3)으로 대략 계산
+        prompt_tokens = len(json.dumps(request.get("messages", []), ensure_ascii=False).encode("utf-8")) // 3
+        completion_tokens = min(self.response_tokens, request.get("max_tokens") or self.response_tokens)
+        words = ["모의 응답입니다."] * completion_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = request.get("model", "mock")
+
+        time.sleep(self.first_token_latency)
+        if not request.get("stream"):
+            time.sleep(self.token_delay * completion_tokens)
+            content = " ".join(words)
+            response_format = request.get("response_format") or {}
+            if response_format.get("type") == "json_schema":
+                content = json.dumps(mock_value(response_format["json_schema"]["schema"]), ensure_ascii=False)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send(chunk):
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        for i, word in enumerate(words):
+            delta = {"content": (" " if i else "") + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            send({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            time.sleep(self.token_delay)
+        send({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send({**base, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_mock_server(port=0, **settings):
+    handler = type("ConfiguredMockOpenAIHandler", (MockOpenAIHandler,), settings)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}  # 종류별 소요 시간(초) 목록
+        self.session_bytes = []
+        self.errors = []
+
+    def add(self, kind, seconds):
+        with self._lock:
+            self.timings.setdefault(kind, []).append(seconds)
+
+    def error(self, student, message):
+        with self._lock:
+            self.errors.append(f"학생 {student}: {message}")
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def _timed_run(metrics, kind, action):
+    start = time.perf_counter()
+    at = action()
+    metrics.add(kind, time.perf_counter() - start)
+    return at
+
+
+def _check(at, metrics, student, where):
+    problems = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+    for problem in problems:
+        metrics.error(student, f"{where}: {problem[:200]}")
+    return not problems
+
+
+# One simulated student: page_1 → page_2 → page_3 (turns) → page_4
+def run_student(index, script, turns, think_time, timeout, metrics):
+    from streamlit.testing.v1 import AppTest
+
+    # secrets는 _install_secrets로 프로세스 전체에 지정 (at.secrets는 script run 동안에만 적용됨)
+    at = AppTest.from_file(script, default_timeout=timeout)
+    try:
+        _timed_run(metrics, "rerun", at.run)
+        at.text_input[0].input(f"{10100 + index}")
+        at.text_input[1].input(f"부하{index}")
+        _timed_run(metrics, "page", _button(at, "다음").click().run)
+        _timed_run(metrics, "page", _button(at, "다음").click().run)
+        if not _check(at, metrics, index, "page_1~2"):
+            return
+
+        for turn in range(turns):
+            time.sleep(random.uniform(0, think_time))
+            at.text_area[0].input(SAMPLE_QUESTIONS[(index + turn) % len(SAMPLE_QUESTIONS)])
+            _timed_run(metrics, "turn", _button(at, "전송").click().run)
+            if not _check(at, metrics, index, f"turn {turn + 1}"):
+                return
+            # 입력 없이 다시 그리는 비용 (대화 기록이 길어질수록 증가)
+            _timed_run(metrics, "rerun", at.run)
+
+        _timed_run(metrics, "finish", _button(at, "다음").click().run)
+        _check(at, metrics, index, "page_4")
+        # 최근 Streamlit의 at.session_state는 to_dict()로, 이전 버전은 filtered_state로 사용자 상태를 돌려줌
+        state = getattr(at.session_state, "to_dict", lambda: at.session_state.filtered_state)()
+        metrics.session_bytes.append(len(pickle.dumps(dict(state))))
+    except Exception as e:
+        metrics.error(index, f"{type(e).__name__}: {e}")
+
+
+def _prepare_database(secrets, layout):
+    if layout != "legacy":
+        return  # 정규화된 테이블은 앱이 처음 저장할 때 만듦
+    import pymysql
+
+    db = pymysql.connect(
+        host=secrets["DB_HOST"], port=secrets["DB_PORT"], user=secrets["DB_USER"],
+        password=secrets["DB_PASSWORD"], database=secrets["DB_DATABASE"], charset="utf8mb4", autocommit=True
+    )
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(LEGACY_TABLE)
+    finally:
+        db.close()
+
+
+# Write the secrets to a temporary secrets.toml and point Streamlit at it
+# (AppTest의 at.secrets는 script run 동안에만 바뀌므로 그 밖에서 연결하는 writer 스레드와 연결 풀은 읽지 못함)
+def _install_secrets(secrets):
+    from streamlit import config
+
+    path = os.path.join(tempfile.mkdtemp(prefix="inq_load_secrets_"), "secrets.toml")
+    with open(path, "w", encoding="utf-8") as f:
+        for key, value in secrets.items():
+            # TOML 문자열은 JSON 문자열과 같은 이스케이프를 씀
+            f.write(f"{key} = {json.dumps(value, ensure_ascii=False)}\n")
+    config.set_option("secrets.files", [path])
+    return path
+
+
+def _writer_status():
+    try:
+        from inq_writer import get_writer
+
+        return get_writer().status()
+    except Exception:
+        return None
+
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def report(metrics, students, elapsed, rss_delta_kb, db_committed, db_seconds):
+    lines = [f"학생 {students}명, 총 {elapsed:.1f}초"]
+    for kind, label in (("turn", "질문→응답"), ("rerun", "rerun"), ("page", "페이지 이동"), ("finish", "피드백+저장")):
+        values = metrics.timings.get(kind, [])
+        lines.append(
+            f"  {label:<8} n={len(values):<4} p50={_format_seconds(percentile(values, 50))} "
+            f"p95={_format_seconds(percentile(values, 95))} p99={_format_seconds(percentile(values, 99))}"
+        )
+    if metrics.session_bytes:
+        lines.append(f"  session_state 평균 {statistics.mean(metrics.session_bytes) / 1024:.1f}KB (pickle 기준)")
+    lines.append(f"  프로세스 최대 RSS 증가 {rss_delta_kb / 1024:.1f}MB (학생당 {rss_delta_kb / 1024 / max(students, 1):.2f}MB)")
+    if db_committed is not None:
+        lines.append(f"  DB 쓰기 {db_committed}건 / {db_seconds:.1f}초 ({db_committed / max(db_seconds, 1e-9):.1f}건/초)")
+    lines.append(f"  오류 {len(metrics.errors)}건")
+    lines.extend(f"    {error}" for error in metrics.errors[:20])
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="모의 OpenAI 서버와 로컬 DB로 동시 접속 학생 수를 시험합니다.")
+    parser.add_argument("--students", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=3, help="학생당 질문 수")
+    parser.add_argument("--stage", choices=sorted(ENTRY_POINTS), default="design")
+    parser.add_argument("--layout", choices=["legacy", "normalized"], default="normalized", help="STORAGE_LAYOUT")
+    parser.add_argument("--ramp", type=float, default=5.0, help="학생들이 접속을 시작하는 데 걸리는 시간(초)")
+    parser.add_argument("--think-time", type=float, default=2.0, help="질문 사이 최대 대기 시간(초)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="한 번의 script run 제한 시간(초)")
+    parser.add_argument("--first-token-latency", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--response-tokens", type=int, default=150)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="429로 응답할 요청 비율")
+    parser.add_argument("--mock-port", type=int, default=0)
+    parser.add_argument("--serve-mock", action="store_true", help="모의 OpenAI 서버만 실행")
+    parser.add_argument("--db-host", default="127.0.0.1")
+    parser.add_argument("--db-port", type=int, default=3306)
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-password", default="root")
+    parser.add_argument("--db-name", default="inq_load")
+    parser.add_argument("--json", dest="json_path", help="결과를 JSON으로도 저장할 경로")
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        args.mock_port,
+        first_token_latency=args.first_token_latency,
+        token_delay=args.token_delay,
+        response_tokens=args.response_tokens,
+        rate_limit_ratio=args.rate_limit_ratio,
+    )
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    if args.serve_mock:
+        print(f"모의 OpenAI 서버: {base_url} (OPENAI_BASE_URL로 지정하세요, Ctrl+C로 종료)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+    # OpenAI 클라이언트는 base_url을 지정하지 않으면 이 환경 변수를 씀
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    secrets = {
+        "OPENAI_API_KEY": "mock-key",
+        "DB_HOST": args.db_host,
+        "DB_PORT": args.db_port,
+        "DB_USER": args.db_user,
+        "DB_PASSWORD": args.db_password,
+        "DB_DATABASE": args.db_name,
+        "STORAGE_LAYOUT": args.layout,
+        "DB_SPOOL_PATH": os.path.join(tempfile.mkdtemp(prefix="inq_load_"), "spool.sqlite3"),
+    }
+    _prepare_database(secrets, args.layout)
+    _install_secrets(secrets)
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), ENTRY_POINTS[args.stage])
+    metrics = Metrics()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    threads = []
+    for index in range(args.students):
+        thread = threading.Thread(
+            target=run_student,
+            args=(index, script, args.turns, args.think_time, args.timeout, metrics),
+            name=f"student-{index}",
+        )
+        thread.start()
+        threads.append(thread)
+        time.sleep(args.ramp / max(args.students, 1))
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # 백그라운드 writer가 밀린 쓰기를 모두 마칠 때까지 기다린 뒤 처리량 계산
+    status = _writer_status()
+    while status and status["alive"] and status["pending"]:
+        time.sleep(0.2)
+        status = _writer_status()
+    db_seconds = time.perf_counter() - started
+    rss_delta_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    server.shutdown()
+
+    db_committed = status["committed"] if status else None
+    print(report(metrics, args.students, elapsed, rss_delta_kb, db_committed, db_seconds))
+    if status and status["spooled"]:
+        print(f"  ⚠ DB에 쓰지 못한 {status['spooled']}건이 스풀에 남았습니다: {secrets['DB_SPOOL_PATH']}")
+    if status and status["dead_letters"]:
+        print(f"  ⚠ 실패한 쓰기 {status['dead_letters']}건이 dead_letter로 옮겨졌습니다: {secrets['DB_SPOOL_PATH']}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "students": args.students,
+                "elapsed": elapsed,
+                "timings": {kind: {str(p): percentile(v, p) for p in (50, 95, 99)} for kind, v in metrics.timings.items()},
+                "session_bytes": metrics.session_bytes,
+                "rss_delta_kb": rss_delta_kb,
+                "db_committed": db_committed,
+                "db_seconds": db_seconds,
+                "errors": metrics.errors,
+            }, f, ensure_ascii=False, indent=2)
+    # writer가 죽었으면 DB 처리량과 스풀 수치가 실제 쓰기를 반영하지 않으므로 실패로 처리
+    if not status or not status["alive"]:
+        raise SystemExit("❌ 백그라운드 writer가 실행 중이 아니어서 DB 쓰기 결과를 믿을 수 없습니다.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# Per-turn latency/token instrumentation: in-process histograms, Prometheus text export and a DB turn log
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # 초
+METRIC_PREFIX = "inq"
+
+TURN_METRICS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS inq_turn_metrics (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        session_key VARCHAR(64) NOT NULL,
+        turn_index INT NOT NULL,
+        stage VARCHAR(32) NOT NULL,
+        time DATETIME NOT NULL,
+        queue_wait_ms INT NOT NULL,
+        first_token_ms INT NULL,
+        total_ms INT NOT NULL,
+        prompt_tokens INT NOT NULL DEFAULT 0,
+        cached_tokens INT NOT NULL DEFAULT 0,
+        completion_tokens INT NOT NULL DEFAULT 0,
+        UNIQUE KEY uq_turn (session_key, turn_index),
+        KEY idx_turn_metrics_time (time)
+    ) DEFAULT CHARSET=utf8mb4
+"""
+# rerun으로 같은 턴을 다시 기록해도 한 행만 남음
+INSERT_TURN_METRICS = """
+    INSERT INTO inq_turn_metrics
+        (session_key, turn_index, stage, time, queue_wait_ms, first_token_ms, total_ms, prompt_tokens, cached_tokens, completion_tokens)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE total_ms = VALUES(total_ms)
+"""
+
+logger = logging.getLogger("inq.metrics")
+
+
+class MetricsRegistry:
+    """Latency histograms and counters shared by every session of the process."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = {}    # (name, labels) -> value
+        self._collectors = []  # 수집 시점에 {name: value}를 돌려주는 함수 (gauge)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    # Register a callback returning {name: value}, read at scrape time and exported as gauges
+    def add_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    # Prometheus text exposition format
+    def render_prometheus(self):
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            collectors = list(self._collectors)
+        typed = set()
+        for (name, labels), values in histograms:
+            metric = f"{METRIC_PREFIX}_{name}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{metric}_bucket{fmt(labels, [('le', bound)])} {count}")
+            lines.append(f"{metric}_bucket{fmt(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{metric}_sum{fmt(labels)} {values[-2]:.6f}")
+            lines.append(f"{metric}_count{fmt(labels)} {values[-1]}")
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{fmt(labels)} {value}")
+        for collect in collectors:
+            for name, value in sorted(collect().items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+                lines.append(f"{METRIC_PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Time a block and record it in the registry (also when the block is cut short by st.rerun/st.stop)
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+# One structured JSON log line per answered turn
+def log_turn(record):
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Serve /metrics on METRICS_PORT (once per process); disabled when the secret is not set
+@st.cache_resource
+def serve_metrics():
+    port = st.secrets.get("METRICS_PORT")
+    if not port:
+        return None
+    server = ThreadingHTTPServer((st.secrets.get("METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="inq-metrics", daemon=True).start()
+    return server
+
+
+def ensure_metrics_table(cursor):
+    cursor.execute(TURN_METRICS_SCHEMA)
+
+
+# (sql, params) write storing one turn's record
+def turn_metrics_ops(record):
+    def ms(seconds):
+        return None if seconds is None else int(seconds * 1000)
+
+    return [(INSERT_TURN_METRICS, (
+        record["session_key"], record["turn_index"], record["stage"], record["time"],
+        ms(record["queue_wait"]), ms(record["first_token"]), ms(record["total"]),
+        record["prompt_tokens"], record["cached_tokens"], record["completion_tokens"],
+    ))]
+
+
+# Per-stage summary of recent turns for the teacher app
+def stage_summary(cursor, since):
+    cursor.execute(
+        """
+        SELECT stage, session_key, queue_wait_ms, first_token_ms, total_ms, prompt_tokens, cached_tokens, completion_tokens
+        FROM inq_turn_metrics
+        WHERE time >= %s
+        """,
+        (since,)
+    )
+    by_stage = {}
+    for stage, session_key, queue_wait, first_token, total, prompt, cached, completion in cursor.fetchall():
+        rows = by_stage.setdefault(stage, {"sessions": set(), "queue": [], "first": [], "total": [], "tokens": [0, 0, 0]})
+        rows["sessions"].add(session_key)
+        rows["queue"].append(queue_wait)
+        if first_token is not None:
+            rows["first"].append(first_token)
+        rows["total"].append(total)
+        rows["tokens"][0] += prompt
+        rows["tokens"][1] += cached
+        rows["tokens"][2] += completion
+
+    summary = []
+    for stage, rows in sorted(by_stage.items()):
+        prompt, cached, completion = rows["tokens"]
+        summary.append({
+            "단계": stage,
+            "세션": len(rows["sessions"]),
+            "턴": len(rows["total"]),
+            "응답 p50(초)": percentile(rows["total"], 50) / 1000,
+            "응답 p95(초)": percentile(rows["total"], 95) / 1000,
+            "첫 토큰 p95(초)": (percentile(rows["first"], 95) or 0) / 1000,
+            "대기 p95(초)": percentile(rows["queue"], 95) / 1000,
+            "프롬프트 토큰": prompt,
+            "캐시 적중률": f"{cached / prompt:.0%}" if prompt else "-",
+            "응답 토큰": completion,
+            "턴당 토큰": round((prompt + completion) / len(rows["total"])),
+        })
+    return summary
@@ -0,0 +1,69 @@
+# Migrate legacy qna JSON blobs into the normalized session/message tables
+#
+# 사용법: python inq_migrate.py [--batch-size 200] [--limit N]
+# 이미 옮긴 행(legacy_qna_id) 다음부터 이어서 진행하므로 중단 후 다시 실행해도 됩니다.
+import argparse
+import json
+
+from inq_db import connect_from_secrets, execute_ops
+from inq_schema import conversation_write_ops, ensure_schema
+
+
+def _messages_from_blob(chat):
+    data = json.loads(chat) if chat else []
+    return [m for m in data if isinstance(m, dict) and "role" in m and "content" in m]
+
+
+def migrate(batch_size=200, limit=None):
+    read_db = connect_from_secrets()
+    write_db = connect_from_secrets()
+    migrated = 0
+    skipped = 0
+    try:
+        with write_db.cursor() as cursor:
+            ensure_schema(cursor)
+            cursor.execute("SELECT COALESCE(MAX(legacy_qna_id), 0) FROM inq_sessions")
+            last_id = cursor.fetchone()[0]
+
+        while limit is None or migrated + skipped < limit:
+            size = batch_size if limit is None else min(batch_size, limit - migrated - skipped)
+            with read_db.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id, number, name, chat, time FROM qna WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, size)
+                )
+                rows = cursor.fetchall()
+            if not rows:
+                break
+
+            ops = []
+            for qna_id, number, name, chat, time in rows:
+                try:
+                    messages = _messages_from_blob(chat)
+                except json.JSONDecodeError:
+                    print(f"qna id {qna_id}: JSON 형식이 잘못되어 건너뜁니다.")
+                    skipped += 1
+                    continue
+                ops.extend(conversation_write_ops(f"qna-{qna_id}", None, str(number), name, time, messages, legacy_qna_id=qna_id))
+                migrated += 1
+
+            # 배치 단위로 커밋하므로 MAX(legacy_qna_id)가 곧 재시작 지점
+            write_db.begin()
+            with write_db.cursor() as cursor:
+                execute_ops(cursor, ops)
+            write_db.commit()
+            last_id = rows[-1][0]
+            print(f"~ qna id {last_id}: {migrated}건 이전, {skipped}건 건너뜀")
+    finally:
+        read_db.close()
+        write_db.close()
+    return migrated, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="qna 테이블의 JSON 대화 기록을 정규화된 테이블로 옮깁니다.")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=None, help="이번 실행에서 처리할 최대 행 수")
+    args = parser.parse_args()
+    migrated, skipped = migrate(args.batch_size, args.limit)
+    print(f"완료: {migrated}건 이전, {skipped}건 건너뜀")
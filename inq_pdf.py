@@ -0,0 +1,46 @@
+# PDF text extraction cached by content hash
+import hashlib
+
+from inq_cache import LRUCache
+
+PDF_MAX_BYTES = 20 * 1024 * 1024   # 이보다 큰 파일은 열지 않음
+PDF_MAX_PAGES = 60                 # 교과서 전체 같은 긴 문서는 앞부분만 추출
+PDF_MAX_CHARS = 300_000            # 추출 텍스트 상한
+PDF_CACHE_MAX_CHARS = 10_000_000   # 캐시 전체 텍스트 상한 (세션 간 공유)
+
+_text_cache = LRUCache(max_entries=64, max_size=PDF_CACHE_MAX_CHARS)
+
+
+class PdfTooLargeError(ValueError):
+    pass
+
+
+def pdf_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _extract(data, max_pages, max_chars):
+    import fitz  # PyMuPDF - PDF가 처음 올라올 때만 불러옴
+
+    pages = []
+    total = 0
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page_number, page in enumerate(doc):
+            if page_number >= max_pages or total >= max_chars:
+                break
+            text = page.get_text()
+            pages.append(text)
+            total += len(text)
+    return "".join(pages)[:max_chars]
+
+
+# Extract text from PDF bytes, reusing earlier results for identical files
+def extract_pdf_text(data, max_pages=PDF_MAX_PAGES, max_chars=PDF_MAX_CHARS):
+    if len(data) > PDF_MAX_BYTES:
+        raise PdfTooLargeError(f"PDF 파일이 너무 큽니다 (최대 {PDF_MAX_BYTES // (1024 * 1024)}MB).")
+    key = (pdf_digest(data), max_pages, max_chars)
+    text = _text_cache.get(key)
+    if text is None:
+        text = _extract(data, max_pages, max_chars)
+        _text_cache.put(key, text)
+    return text
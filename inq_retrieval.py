@@ -0,0 +1,131 @@
+# Local BM25 retrieval over extracted PDF text
+import hashlib
+import math
+import re
+from collections import Counter
+
+from inq_cache import LRUCache
+from inq_context import count_text_tokens
+
+CHUNK_CHARS = 700        # 청크 목표 길이 (한글 기준 약 500~700토큰)
+CHUNK_OVERLAP = 100      # 문단 경계가 잘려도 문맥이 이어지도록 겹치는 길이
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TERM_RE = re.compile(r"[가-힣]+|[a-zA-Z]+|\d+(?:\.\d+)?")
+_index_cache = LRUCache(max_entries=64)
+
+
+# Lexical terms: Hangul as character bigrams (조사가 붙어도 매칭되도록), others as lowercased words
+def tokenize(text):
+    terms = []
+    for word in _TERM_RE.findall(text):
+        if "가" <= word[0] <= "힣":
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word.lower())
+    return terms
+
+
+def split_chunks(text, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    chunks = []
+    current = ""
+    for paragraph in paragraphs:
+        # 너무 긴 문단은 고정 길이로 자름
+        while len(paragraph) > chunk_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:chunk_chars])
+            paragraph = paragraph[chunk_chars - overlap:]
+        if current and len(current) + len(paragraph) + 1 > chunk_chars:
+            chunks.append(current)
+            current = current[-overlap:] + "\n" + paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if chunks else 0
+        doc_freqs = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def scores(self, query):
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length) if self.avg_length else BM25_K1
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query, k):
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [i for i in ranked[:k] if scores[i] > 0]
+
+
+# Build (or reuse) the index for a document; keyed by content hash so each PDF is indexed once
+def get_index(text):
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    index = _index_cache.get(key)
+    if index is None:
+        index = BM25Index(split_chunks(text))
+        _index_cache.put(key, index)
+    return index
+
+
+# Top-k chunks relevant to the query, in document order, within a token budget
+def retrieve_context(text, query, k=4, token_budget=1500):
+    index = get_index(text)
+    if not index.chunks:
+        return ""
+    selected = index.search(query, k) if query.strip() else []
+    if not selected:
+        # 관련 청크가 없으면 문서 앞부분(제목/개요)을 사용
+        selected = [0]
+    picked = []
+    used = 0
+    for i in selected:
+        tokens = count_text_tokens(index.chunks[i])
+        if used + tokens > token_budget:
+            continue
+        picked.append(i)
+        used += tokens
+    if not picked:
+        return index.chunks[selected[0]][:token_budget]
+    return "\n\n...\n\n".join(index.chunks[i] for i in sorted(picked))
+
+
+# Opening chunks of a document within a token budget (stable, so it can be pinned in the prompt prefix)
+def document_overview(text, token_budget=800):
+    index = get_index(text)
+    picked = []
+    used = 0
+    for chunk in index.chunks:
+        tokens = count_text_tokens(chunk)
+        if used + tokens > token_budget:
+            break
+        picked.append(chunk)
+        used += tokens
+    if not picked and index.chunks:
+        return index.chunks[0][:token_budget]
+    return "\n\n".join(picked)
@@ -0,0 +1,147 @@
+# Per-call model routing: candidate models per call type with latency/cost budgets and fallback on failure
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import openai
+import streamlit as st
+
+from inq_metrics import percentile, registry
+
+LARGE_MODEL = "gpt-4o"
+SMALL_MODEL = "gpt-4o-mini"
+MODEL_PRICES = {LARGE_MODEL: (2.50, 10.00), SMALL_MODEL: (0.15, 0.60)}  # 100만 토큰당 가격(USD): (입력, 출력)
+LATENCY_WINDOW = 200       # 경로·모델별로 기억하는 최근 응답 시간 수
+LATENCY_MAX_AGE = 300      # 이보다 오래된 기록은 버림(초), 예산을 넘어 뒤로 밀린 모델도 이후 다시 시도됨
+LATENCY_MIN_SAMPLES = 20   # 기록이 이보다 적으면 지연 예산으로 거르지 않음
+CLIENT_MAX_RETRIES = 2     # 마지막 후보 모델에서 OpenAI 클라이언트가 스스로 재시도하는 횟수
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Route:
+    models: tuple                 # 시도할 모델 (앞에서부터, 실패하면 다음 모델)
+    timeout: float = 60.0         # 요청 한 번의 제한 시간(초)
+    latency_budget: float = None  # 최근 p95 응답 시간이 이보다 긴 모델은 뒤로 미룸(초)
+    cost_budget: float = None     # 예상 비용이 이보다 큰 모델은 뒤로 미룸(USD)
+
+
+# 호출 종류별 경로 (secrets의 MODEL_ROUTES로 덮어쓰고, "analysis.followup"처럼 단계별로도 지정 가능)
+ROUTES = {
+    "evaluation": Route((LARGE_MODEL, SMALL_MODEL), timeout=60, latency_budget=45),  # 첫 제출에 대한 채점 기준별 평가
+    "followup": Route((SMALL_MODEL, LARGE_MODEL), timeout=30, latency_budget=15),    # 그 뒤의 질문과 답변
+    "rubric": Route((LARGE_MODEL, SMALL_MODEL), timeout=45),                         # 평가를 항목별 점수로 정리
+    "summary": Route((SMALL_MODEL, LARGE_MODEL), timeout=30),                        # 오래된 대화 요약
+    "feedback": Route((LARGE_MODEL, SMALL_MODEL), timeout=120),                      # page_4 요약과 피드백
+}
+
+
+@dataclass
+class ModelChoice:
+    model: str
+    timeout: float
+    max_retries: int
+    elapsed: float = None  # 호출한 쪽이 대기 시간을 뺀 실제 요청 시간을 기록하면 지연 통계에 사용
+
+
+# Timeouts, connection errors, rate limits left after the scheduler's retries and 5xx responses
+def should_fall_back(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(error, openai.APIError) and status is not None and (status == 429 or status >= 500)
+
+
+class ModelRouter:
+    """Picks the model for each call from its route and falls back to the next candidate on failure.
+
+    Recent latencies are kept per (route, model); a model whose p95 exceeds the route's latency
+    budget, or whose estimated cost exceeds the cost budget, is tried only after the others.
+    """
+
+    def __init__(self, routes=ROUTES, prices=MODEL_PRICES):
+        self.routes = routes
+        self.prices = prices
+        self._latencies = {}  # (route, model) -> deque of (monotonic time, seconds)
+        self._lock = threading.Lock()
+
+    def route(self, name, stage_key=None):
+        return self.routes.get(f"{stage_key}.{name}") or self.routes[name]
+
+    def estimated_cost(self, model, prompt_tokens, completion_tokens):
+        prices = self.prices.get(model)
+        if prices is None:
+            return 0.0
+        return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+    def p95(self, name, model):
+        now = time.monotonic()
+        with self._lock:
+            samples = self._latencies.get((name, model))
+            if not samples:
+                return None
+            while samples and now - samples[0][0] > LATENCY_MAX_AGE:
+                samples.popleft()
+            values = [seconds for _, seconds in samples]
+        return percentile(values, 95) if len(values) >= LATENCY_MIN_SAMPLES else None
+
+    # Models to try in order: those within budget first, the rest kept as fallbacks
+    def candidates(self, name, stage_key, prompt_tokens, completion_tokens):
+        route = self.route(name, stage_key)
+        within, over = [], []
+        for model in route.models:
+            p95 = self.p95(name, model)
+            too_slow = route.latency_budget is not None and p95 is not None and p95 > route.latency_budget
+            too_costly = route.cost_budget is not None and self.estimated_cost(model, prompt_tokens, completion_tokens) > route.cost_budget
+            (over if too_slow or too_costly else within).append(model)
+        return route, within + over
+
+    def record(self, name, model, seconds, ok=True):
+        with self._lock:
+            samples = self._latencies.setdefault((name, model), deque(maxlen=LATENCY_WINDOW))
+            samples.append((time.monotonic(), seconds))
+        registry.observe("model_call", seconds, route=name, model=model, outcome="ok" if ok else "error")
+
+    # Run fn(choice) with each candidate until one succeeds
+    def run(self, name, stage_key, fn, prompt_tokens, completion_tokens):
+        route, models = self.candidates(name, stage_key, prompt_tokens, completion_tokens)
+        for i, model in enumerate(models):
+            last = i == len(models) - 1
+            # 다음 후보가 있으면 같은 모델로 재시도하지 않고 바로 넘어감
+            choice = ModelChoice(model, route.timeout, CLIENT_MAX_RETRIES if last else 0)
+            started = time.perf_counter()
+            try:
+                result = fn(choice)
+            except Exception as e:
+                self.record(name, model, choice.elapsed if choice.elapsed is not None else time.perf_counter() - started, ok=False)
+                if last or not should_fall_back(e):
+                    raise
+                registry.inc("model_fallbacks", route=name, model=model)
+                logger.warning("%s failed on %s, falling back to %s: %s", name, model, models[i + 1], e)
+                continue
+            self.record(name, model, choice.elapsed if choice.elapsed is not None else time.perf_counter() - started)
+            return result
+
+
+# Routing table from ROUTES, overridden per route by the MODEL_ROUTES secret
+# 예) [MODEL_ROUTES.followup]
+#     models = ["gpt-4o-mini", "gpt-4o"]
+#     timeout = 20
+#     latency_budget = 10
+@st.cache_resource
+def get_router():
+    routes = dict(ROUTES)
+    for name, config in dict(st.secrets.get("MODEL_ROUTES", {})).items():
+        base = routes.get(name) or routes.get(name.split(".")[-1]) or Route((LARGE_MODEL,))
+        routes[name] = Route(
+            models=tuple(config.get("models", base.models)),
+            timeout=float(config.get("timeout", base.timeout)),
+            latency_budget=config.get("latency_budget", base.latency_budget),
+            cost_budget=config.get("cost_budget", base.cost_budget),
+        )
+    prices = dict(MODEL_PRICES)
+    prices.update({model: tuple(price) for model, price in dict(st.secrets.get("MODEL_PRICES", {})).items()})
+    return ModelRouter(routes, prices)
@@ -0,0 +1,150 @@
+# Structured rubric scores: JSON-schema output format, score rows with indexed columns and per-class totals
+import hashlib
+import json
+
+from inq_context import message_text
+
+CRITERIA_COUNT = 8  # 두 단계 모두 채점 기준이 8개
+CRITERIA_COLUMNS = [f"c{i}" for i in range(1, CRITERIA_COUNT + 1)]
+
+SCORING_INSTRUCTIONS = (
+    "방금 제시한 평가를 채점 기준 항목별로 정리하세요. "
+    "학생이 처음 제출한 내용이 각 기준을 충족하면 met을 true, 개선이 필요하면 false로 하고, reason에 한 문장으로 근거를 쓰세요."
+)
+
+_COLUMNS = ", ".join(CRITERIA_COLUMNS)
+RUBRIC_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS inq_rubric_scores (
+        score_key VARCHAR(80) NOT NULL PRIMARY KEY,
+        stage VARCHAR(32) NOT NULL,
+        class_prefix VARCHAR(8) NOT NULL,
+        number VARCHAR(16) NOT NULL,
+        source VARCHAR(16) NOT NULL,
+        time DATETIME NOT NULL,
+        {", ".join(f"{column} TINYINT NOT NULL" for column in CRITERIA_COLUMNS)},
+        KEY idx_rubric_class (stage, class_prefix),
+        KEY idx_rubric_number (number)
+    ) DEFAULT CHARSET=utf8mb4
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS inq_rubric_class_totals (
+        stage VARCHAR(32) NOT NULL,
+        class_prefix VARCHAR(8) NOT NULL,
+        sessions INT NOT NULL DEFAULT 0,
+        {", ".join(f"{column} INT NOT NULL DEFAULT 0" for column in CRITERIA_COLUMNS)},
+        PRIMARY KEY (stage, class_prefix)
+    ) DEFAULT CHARSET=utf8mb4
+    """,
+]
+# 다시 채점된 세션은 예전 점수를 반 합계에서 먼저 뺀 뒤 새 점수를 더함 (writer가 한 트랜잭션으로 실행)
+SUBTRACT_PREVIOUS = f"""
+    UPDATE inq_rubric_class_totals t
+    JOIN inq_rubric_scores s ON s.stage = t.stage AND s.class_prefix = t.class_prefix
+    SET t.sessions = t.sessions - 1, {", ".join(f"t.{column} = t.{column} - s.{column}" for column in CRITERIA_COLUMNS)}
+    WHERE s.score_key = %s
+"""
+UPSERT_SCORES = f"""
+    INSERT INTO inq_rubric_scores (score_key, stage, class_prefix, number, source, time, {_COLUMNS})
+    VALUES (%s, %s, %s, %s, %s, %s, {", ".join(["%s"] * CRITERIA_COUNT)})
+    ON DUPLICATE KEY UPDATE stage = VALUES(stage), class_prefix = VALUES(class_prefix), number = VALUES(number),
+        source = VALUES(source), time = VALUES(time), {", ".join(f"{column} = VALUES({column})" for column in CRITERIA_COLUMNS)}
+"""
+# 두 테이블에 같은 이름의 열이 있으므로 갱신할 열은 테이블 이름을 붙여 지정
+ADD_CURRENT = f"""
+    INSERT INTO inq_rubric_class_totals (stage, class_prefix, sessions, {_COLUMNS})
+    SELECT stage, class_prefix, 1, {_COLUMNS} FROM inq_rubric_scores WHERE score_key = %s
+    ON DUPLICATE KEY UPDATE inq_rubric_class_totals.sessions = inq_rubric_class_totals.sessions + 1,
+        {", ".join(f"inq_rubric_class_totals.{column} = inq_rubric_class_totals.{column} + VALUES({column})" for column in CRITERIA_COLUMNS)}
+"""
+
+
+# response_format for a score object with one {met, reason} entry per criterion
+def score_format(stage):
+    criterion = lambda text: {
+        "type": "object",
+        "description": text,
+        "properties": {"met": {"type": "boolean"}, "reason": {"type": "string"}},
+        "required": ["met", "reason"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "rubric_scores",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {column: criterion(text) for column, text in zip(CRITERIA_COLUMNS, stage.rubric)},
+                "required": CRITERIA_COLUMNS,
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+# Score object from a structured-output response; raises ValueError when it does not match the schema
+def parse_scores(text):
+    try:
+        data = json.loads(text)
+        return {column: {"met": bool(data[column]["met"]), "reason": str(data[column].get("reason", ""))} for column in CRITERIA_COLUMNS}
+    except (TypeError, KeyError, json.JSONDecodeError) as e:
+        raise ValueError(f"채점 결과 형식이 올바르지 않습니다: {e}") from e
+
+
+# Readable per-criterion text of a score object (teacher app and batch results)
+def format_scores(scores, stage):
+    lines = []
+    for column, text in zip(CRITERIA_COLUMNS, stage.rubric):
+        score = scores[column]
+        lines.append(f"{text} {'충족' if score['met'] else '미흡'} - {score['reason']}")
+    return "\n\n".join(lines)
+
+
+def class_of(number):
+    # 학번 10312 = 1학년 03반 12번 → 반 103 (inq_db.build_filters와 같은 규칙)
+    return str(number)[:-2]
+
+
+# Score key of a session stored in the legacy layout: qna rows have no session_key, so the live
+# scorer and the batch job both derive the key from the student number and the first submission
+def submission_key(number, content):
+    digest = hashlib.sha256(f"{number}\n{message_text(content)}".encode("utf-8")).hexdigest()
+    return f"sub:{digest}"
+
+
+# (sql, params) writes storing a session's scores and moving its class totals accordingly
+def score_ops(score_key, stage_key, number, source, time, scores):
+    values = [int(scores[column]["met"]) for column in CRITERIA_COLUMNS]
+    return [
+        (SUBTRACT_PREVIOUS, (score_key,)),
+        (UPSERT_SCORES, (score_key, stage_key, class_of(number), number, source, time, *values)),
+        (ADD_CURRENT, (score_key,)),
+    ]
+
+
+def ensure_rubric_tables(cursor):
+    for statement in RUBRIC_SCHEMA:
+        cursor.execute(statement)
+
+
+# Per-class totals of a stage as (class_prefix, sessions, [met count per criterion]) rows
+def class_totals(cursor, stage_key, class_prefix=""):
+    query = f"SELECT class_prefix, sessions, {_COLUMNS} FROM inq_rubric_class_totals WHERE stage = %s"
+    params = [stage_key]
+    if class_prefix:
+        query += " AND class_prefix = %s"
+        params.append(class_prefix)
+    cursor.execute(query + " ORDER BY class_prefix", params)
+    return [(row[0], row[1], list(row[2:])) for row in cursor.fetchall() if row[1] > 0]
+
+
+# Students of a class whose submission did not meet one criterion, as (number, time) rows
+def students_missing(cursor, stage_key, class_prefix, column):
+    if column not in CRITERIA_COLUMNS:
+        raise ValueError(column)
+    cursor.execute(
+        f"SELECT number, time FROM inq_rubric_scores WHERE stage = %s AND class_prefix = %s AND {column} = 0 ORDER BY number",
+        (stage_key, class_prefix)
+    )
+    return cursor.fetchall()
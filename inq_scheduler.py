@@ -0,0 +1,217 @@
+# Process-wide OpenAI request scheduler: rate limits, bounded concurrency and per-session fair queuing
+import email.utils
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import streamlit as st
+
+OPENAI_RPM = 500              # 분당 요청 수 상한 (조직 등급에 맞게 secrets에서 조정)
+OPENAI_TPM = 30000            # 분당 토큰 수 상한 (프롬프트 + 최대 응답 추정치)
+OPENAI_MAX_CONCURRENCY = 8    # 동시에 진행하는 요청 수 상한 (스트리밍 중인 요청 포함)
+RATE_LIMIT_RETRIES = 4        # 429 응답을 받았을 때 다시 시도하는 횟수
+RATE_LIMIT_BACKOFF = 2.0      # Retry-After가 없을 때의 첫 대기 시간(초), 매번 두 배
+RATE_LIMIT_MAX_BACKOFF = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` can be taken (0 when available now)
+    def wait_time(self, amount, now):
+        self._refill(now)
+        # 한 번에 용량보다 큰 요청은 버킷이 가득 찼을 때 보내고 잔량을 음수로 둠
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class _Ticket:
+    __slots__ = ("session_key", "tokens", "seq")
+
+    def __init__(self, session_key, tokens, seq):
+        self.session_key = session_key
+        self.tokens = tokens
+        self.seq = seq
+
+
+class OpenAIScheduler:
+    """Admits OpenAI calls from every Streamlit session of the process one at a time.
+
+    Waiting calls are queued per session and sessions are served round-robin, so one session
+    cannot starve the others. A call is admitted when a concurrency slot is free and the
+    request/token buckets allow it; a 429 pauses admission for the whole process until the
+    server's Retry-After has passed.
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_concurrency=OPENAI_MAX_CONCURRENCY):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._queues = OrderedDict()  # session_key -> deque[_Ticket], 맨 앞 세션이 다음 차례
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rate_limited = 0
+
+    # 1-based position of a ticket in the round-robin dispatch order
+    def _position(self, ticket):
+        queues = [list(q) for q in self._queues.values()]
+        position = 0
+        for depth in range(max((len(q) for q in queues), default=0)):
+            for q in queues:
+                if depth < len(q):
+                    position += 1
+                    if q[depth] is ticket:
+                        return position
+        return position
+
+    def _next_ticket(self):
+        for q in self._queues.values():
+            return q[0]
+        return None
+
+    # Seconds the head ticket still has to wait (0 when it can go now)
+    def _admission_wait(self, ticket, now):
+        if self.in_flight >= self.max_concurrency:
+            return None  # 슬롯이 빌 때 notify로 깨어남
+        return max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now))
+
+    def _admit(self, ticket):
+        self.requests.take(1)
+        self.tokens.take(min(ticket.tokens, self.tokens.capacity))
+        self.in_flight += 1
+        self.admitted += 1
+        q = self._queues.pop(ticket.session_key)
+        q.popleft()
+        if q:
+            # 같은 세션의 다음 요청은 다른 세션들 뒤로 보냄
+            self._queues[ticket.session_key] = q
+
+    def _discard(self, ticket):
+        q = self._queues.get(ticket.session_key)
+        if q is not None and ticket in q:
+            q.remove(ticket)
+            if not q:
+                del self._queues[ticket.session_key]
+        self._cond.notify_all()
+
+    # Hold a slot for one call; `on_wait(position)` is called while queued
+    @contextmanager
+    def slot(self, session_key, estimated_tokens, on_wait=None):
+        with self._cond:
+            ticket = _Ticket(session_key, estimated_tokens, next(self._seq))
+            self._queues.setdefault(session_key, deque()).append(ticket)
+            admitted = False
+            last_position = None
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._next_ticket() is ticket:
+                        wait = self._admission_wait(ticket, now)
+                        if wait == 0:
+                            self._admit(ticket)
+                            admitted = True
+                            break
+                    position = self._position(ticket)
+                    if on_wait is not None and position != last_position:
+                        last_position = position
+                        on_wait(position)
+                    self._cond.wait(timeout=wait)
+            finally:
+                # 대기 중 rerun 등으로 중단되면 줄에서 빠짐
+                if not admitted:
+                    self._discard(ticket)
+                else:
+                    self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    # Stop admitting new calls for `seconds` (shared by every session after a 429)
+    def pause(self, seconds):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.rate_limited += 1
+            self._cond.notify_all()
+
+    # Run `fn()` inside a slot, retrying 429 responses with Retry-After-aware backoff
+    def call(self, session_key, fn, estimated_tokens, on_wait=None, retries=RATE_LIMIT_RETRIES):
+        for attempt in range(retries + 1):
+            try:
+                with self.slot(session_key, estimated_tokens, on_wait):
+                    return fn()
+            except Exception as e:
+                if getattr(e, "status_code", None) != 429 or attempt == retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(RATE_LIMIT_BACKOFF * 2 ** attempt, RATE_LIMIT_MAX_BACKOFF) * random.uniform(0.8, 1.2)
+                logger.warning("OpenAI rate limited, retrying in %.1fs (attempt %d)", delay, attempt + 1)
+                self.pause(delay)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": sum(len(q) for q in self._queues.values()),
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rate_limited": self.rate_limited,
+            }
+
+
+# Seconds to wait according to a 429 response's headers, if it says
+def retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        # HTTP 날짜 형식
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@st.cache_resource
+def get_scheduler():
+    return OpenAIScheduler(
+        rpm=int(st.secrets.get("OPENAI_RPM", OPENAI_RPM)),
+        tpm=int(st.secrets.get("OPENAI_TPM", OPENAI_TPM)),
+        max_concurrency=int(st.secrets.get("OPENAI_MAX_CONCURRENCY", OPENAI_MAX_CONCURRENCY))
+    )
@@ -0,0 +1,197 @@
+# Normalized conversation storage: sessions, per-turn messages and out-of-line attachments
+import base64
+import hashlib
+import re
+
+import streamlit as st
+
+from inq_context import count_content_tokens
+
+SUMMARY_TURN_INDEX = -1    # 최종 요약은 세션마다 한 행만 두고 다시 생성되면 덮어씀
+LEGACY = "legacy"          # qna.chat 한 칸에 JSON 통째로 저장
+NORMALIZED = "normalized"  # inq_sessions / inq_messages / inq_attachments
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS inq_sessions (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        session_key VARCHAR(64) NOT NULL,
+        stage VARCHAR(32) NULL,
+        number VARCHAR(16) NOT NULL,
+        name VARCHAR(64) NOT NULL,
+        time DATETIME NOT NULL,
+        legacy_qna_id INT NULL,
+        UNIQUE KEY uq_session_key (session_key),
+        UNIQUE KEY uq_legacy_qna_id (legacy_qna_id),
+        KEY idx_sessions_number_id (number, id),
+        KEY idx_sessions_time_id (time, id)
+    ) DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inq_messages (
+        session_key VARCHAR(64) NOT NULL,
+        turn_index INT NOT NULL,
+        role VARCHAR(16) NOT NULL,
+        kind VARCHAR(16) NOT NULL DEFAULT 'chat',
+        text MEDIUMTEXT NOT NULL,
+        token_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (session_key, turn_index)
+    ) DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inq_attachments (
+        sha256 CHAR(64) NOT NULL PRIMARY KEY,
+        mime_type VARCHAR(64) NOT NULL,
+        byte_size INT NOT NULL,
+        data MEDIUMBLOB NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inq_message_attachments (
+        session_key VARCHAR(64) NOT NULL,
+        turn_index INT NOT NULL,
+        position INT NOT NULL,
+        sha256 CHAR(64) NOT NULL,
+        PRIMARY KEY (session_key, turn_index, position)
+    )
+    """,
+]
+
+UPSERT_SESSION = """
+    INSERT INTO inq_sessions (session_key, stage, number, name, time, legacy_qna_id)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE name = VALUES(name), time = VALUES(time)
+"""
+UPSERT_MESSAGE = """
+    INSERT INTO inq_messages (session_key, turn_index, role, kind, text, token_count)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE role = VALUES(role), kind = VALUES(kind), text = VALUES(text), token_count = VALUES(token_count)
+"""
+# 파라미터는 JSON 스풀을 거칠 수 있으므로 이미지 바이트는 base64 문자열로 넘기고 DB에서 디코딩
+INSERT_ATTACHMENT = """
+    INSERT IGNORE INTO inq_attachments (sha256, mime_type, byte_size, data)
+    VALUES (%s, %s, %s, FROM_BASE64(%s))
+"""
+LINK_ATTACHMENT = """
+    INSERT INTO inq_message_attachments (session_key, turn_index, position, sha256)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE sha256 = VALUES(sha256)
+"""
+
+_DATA_URL_RE = re.compile(r"^data:([^;,]+);base64,(.*)$", re.DOTALL)
+
+
+# 기본은 턴마다 기록하는 정규화 저장 (qna 테이블만 쓰던 기존 배포는 inq_migrate.py로 옮기거나 STORAGE_LAYOUT = "legacy")
+def storage_layout():
+    return st.secrets.get("STORAGE_LAYOUT", NORMALIZED)
+
+
+def ensure_schema(cursor):
+    for statement in SCHEMA:
+        cursor.execute(statement)
+
+
+# Create the normalized tables once per process
+@st.cache_resource
+def prepare_schema():
+    from inq_db import get_pool  # pymysql은 DB를 실제로 쓸 때만 불러옴
+
+    with get_pool().connection() as db:
+        with db.cursor() as cursor:
+            ensure_schema(cursor)
+
+
+# Split message content into text and (sha256, mime_type, byte_size, base64) attachments
+def split_content(content):
+    if isinstance(content, str):
+        return content, []
+    parts = content if isinstance(content, list) else [content]
+    texts = []
+    attachments = []
+    for part in parts:
+        if not isinstance(part, dict):
+            texts.append(str(part))
+        elif part.get("type") == "text":
+            texts.append(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            match = _DATA_URL_RE.match(part.get("image_url", {}).get("url", ""))
+            if match:
+                mime_type, encoded = match.groups()
+                data = base64.b64decode(encoded)
+                attachments.append((hashlib.sha256(data).hexdigest(), mime_type, len(data), encoded))
+    return "\n".join(texts), attachments
+
+
+# (sql, params) writes storing one message; safe to repeat (upserts keyed by session and turn)
+def message_write_ops(session_key, turn_index, message, kind="chat"):
+    text, attachments = split_content(message["content"])
+    ops = [(UPSERT_MESSAGE, (session_key, turn_index, message["role"], kind, text, count_content_tokens(message["content"])))]
+    for position, (digest, mime_type, byte_size, encoded) in enumerate(attachments):
+        ops.append((INSERT_ATTACHMENT, (digest, mime_type, byte_size, encoded)))
+        ops.append((LINK_ATTACHMENT, (session_key, turn_index, position, digest)))
+    return ops
+
+
+def session_write_ops(session_key, stage, number, name, time, legacy_qna_id=None):
+    return [(UPSERT_SESSION, (session_key, stage, number, name, time, legacy_qna_id))]
+
+
+def summary_write_ops(session_key, summary_message):
+    return message_write_ops(session_key, SUMMARY_TURN_INDEX, summary_message, "summary")
+
+
+# (sql, params) writes storing a whole conversation whose last assistant message is the summary
+def conversation_write_ops(session_key, stage, number, name, time, messages, legacy_qna_id=None):
+    ops = session_write_ops(session_key, stage, number, name, time, legacy_qna_id)
+    if messages and messages[-1].get("role") == "assistant":
+        ops.extend(summary_write_ops(session_key, messages[-1]))
+        messages = messages[:-1]
+    for turn_index, message in enumerate(messages):
+        ops.extend(message_write_ops(session_key, turn_index, message))
+    return ops
+
+
+# Rebuild structured messages of a session (summary last); images come back as data URLs only when asked for
+def load_messages(cursor, session_id, include_images=True):
+    cursor.execute(
+        """
+        SELECT m.turn_index, m.role, m.kind, m.text
+        FROM inq_messages m JOIN inq_sessions s ON s.session_key = m.session_key
+        WHERE s.id = %s
+        ORDER BY m.turn_index < 0, m.turn_index
+        """,
+        (session_id,)
+    )
+    rows = cursor.fetchall()
+    images = load_images(cursor, session_id) if include_images else {}
+    return [
+        {"role": role, "kind": kind, "content": message_content(text, images.get(turn_index))}
+        for turn_index, role, kind, text in rows
+    ]
+
+
+# Image parts of a session as {turn_index: [image_url parts with data URLs]}
+def load_images(cursor, session_id):
+    cursor.execute(
+        """
+        SELECT l.turn_index, l.position, a.mime_type, a.data
+        FROM inq_message_attachments l
+        JOIN inq_sessions s ON s.session_key = l.session_key
+        JOIN inq_attachments a ON a.sha256 = l.sha256
+        WHERE s.id = %s
+        ORDER BY l.turn_index, l.position
+        """,
+        (session_id,)
+    )
+    images = {}
+    for turn_index, _, mime_type, data in cursor.fetchall():
+        url = f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+        images.setdefault(turn_index, []).append({"type": "image_url", "image_url": {"url": url}})
+    return images
+
+
+# Message content from stored text and image parts (text only when there are no images)
+def message_content(text, image_parts=None):
+    if not image_parts:
+        return text
+    return ([{"type": "text", "text": text}] if text else []) + image_parts
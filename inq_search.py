@@ -0,0 +1,148 @@
+# Full-text search over stored conversations (MySQL FULLTEXT with the ngram parser for Korean)
+import json
+import logging
+import re
+import threading
+import time
+
+import pymysql
+
+from inq_context import message_text
+
+SEARCH_LIMIT = 100          # 한 번에 보여줄 최대 일치 메시지 수
+SYNC_BATCH_SIZE = 20        # 레거시 qna를 검색 테이블로 옮길 때 한 번에 읽는 행 수 (chat에 base64 이미지가 섞여 있어 작게)
+SNIPPET_CHARS = 60          # 검색어 앞뒤로 보여줄 글자 수
+SYNC_INTERVAL = 30          # 교사용 앱이 새로 저장된 qna 행을 검색 색인에 반영하는 간격(초)
+
+# 레거시 qna.chat에는 base64 이미지가 섞여 있어 그대로 색인하지 않고, 메시지 텍스트만 따로 모아 색인
+LEGACY_SEARCH_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS inq_qna_search (
+        qna_id INT NOT NULL,
+        turn_index INT NOT NULL,
+        role VARCHAR(16) NOT NULL,
+        text MEDIUMTEXT NOT NULL,
+        PRIMARY KEY (qna_id, turn_index),
+        FULLTEXT KEY ft_qna_search_text (text) WITH PARSER ngram
+    ) DEFAULT CHARSET=utf8mb4
+"""
+INSERT_LEGACY_SEARCH = """
+    INSERT IGNORE INTO inq_qna_search (qna_id, turn_index, role, text)
+    VALUES (%s, %s, %s, %s)
+"""
+
+_QUERY_SPECIAL_RE = re.compile(r'[+\-><()~*"@]')
+
+logger = logging.getLogger(__name__)
+
+
+# Search terms of a query (ngram 색인은 두 글자 단위이므로 한 글자 검색어는 찾을 수 없음)
+def query_terms(query):
+    return [term for term in _QUERY_SPECIAL_RE.sub(" ", query).split() if term]
+
+
+# BOOLEAN MODE query requiring every term as a phrase (ngram 토큰이 이어서 나타나야 일치)
+def boolean_query(terms):
+    return " ".join(f'+"{term}"' for term in terms)
+
+
+def ensure_legacy_search_table(cursor):
+    cursor.execute(LEGACY_SEARCH_SCHEMA)
+
+
+# (qna_id, turn_index, role, text) rows of a stored qna.chat, images left out
+def legacy_search_rows(qna_id, chat):
+    try:
+        messages = json.loads(chat) if chat else []
+    except json.JSONDecodeError:
+        return []
+    rows = []
+    for turn_index, message in enumerate(messages):
+        if isinstance(message, dict) and "content" in message:
+            # 이미지는 검색 대상이 아니므로 빈 문자열로 대체
+            text = message_text(message["content"], image_placeholder="")
+            if text.strip():
+                rows.append((qna_id, turn_index, message.get("role", ""), text))
+    return rows
+
+
+# Copy qna rows added since the last sync into inq_qna_search; returns the number of rows read
+# (백그라운드 스레드나 inq_batch.py에서 실행, chat은 서버 측 커서로 한 행씩 받아 텍스트만 남기므로 이미지가 든 행을 여러 개 메모리에 쌓지 않음)
+def sync_legacy_index(db):
+    with db.cursor() as cursor:
+        ensure_legacy_search_table(cursor)
+        cursor.execute("SELECT COALESCE(MAX(qna_id), 0) FROM inq_qna_search")
+        last_id = cursor.fetchone()[0]
+    synced = 0
+    while True:
+        params = []
+        read = 0
+        # 서버 측 커서를 다 읽어야 같은 연결로 쓸 수 있으므로 작은 묶음씩 읽고 나서 기록
+        with db.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute("SELECT id, chat FROM qna WHERE id > %s ORDER BY id LIMIT %s", (last_id, SYNC_BATCH_SIZE))
+            for qna_id, chat in cursor:
+                params.extend(legacy_search_rows(qna_id, chat))
+                last_id = qna_id
+                read += 1
+        if not read:
+            return synced
+        if params:
+            with db.cursor() as cursor:
+                cursor.executemany(INSERT_LEGACY_SEARCH, params)
+        synced += read
+
+
+# Keep inq_qna_search up to date on a daemon thread, off the request path
+def start_legacy_sync(pool, interval=SYNC_INTERVAL):
+    def loop():
+        while True:
+            try:
+                with pool.connection() as db:
+                    sync_legacy_index(db)
+            except Exception as e:
+                # DB가 잠시 끊겨도 다음 주기에 이어서 반영
+                logger.warning("search index sync failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="inq-search-sync", daemon=True)
+    thread.start()
+    return thread
+
+
+# Matching messages as (record id, number, name, time, stage, turn_index, role, text), best match first
+def search_messages(cursor, terms, conditions, params, normalized, stage=None, limit=SEARCH_LIMIT):
+    match = boolean_query(terms)
+    conditions = list(conditions)
+    params = list(params)
+    if normalized:
+        if stage:
+            conditions.append("s.stage = %s")
+            params.append(stage)
+        source = """
+            SELECT s.id, s.number, s.name, s.time, s.stage, m.turn_index, m.role, m.text,
+                   MATCH(m.text) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM inq_messages m JOIN inq_sessions s ON s.session_key = m.session_key
+            WHERE MATCH(m.text) AGAINST (%s IN BOOLEAN MODE)
+        """
+    else:
+        source = """
+            SELECT q.id, q.number, q.name, q.time, NULL, t.turn_index, t.role, t.text,
+                   MATCH(t.text) AGAINST (%s IN BOOLEAN MODE) AS score
+            FROM inq_qna_search t JOIN qna q ON q.id = t.qna_id
+            WHERE MATCH(t.text) AGAINST (%s IN BOOLEAN MODE)
+        """
+    where = "".join(f" AND {condition}" for condition in conditions)
+    cursor.execute(f"{source}{where} ORDER BY score DESC, time DESC LIMIT %s", [match, match] + params + [limit])
+    return [row[:8] for row in cursor.fetchall()]
+
+
+# Short excerpt around the first matching term, with matches in bold
+def snippet(text, terms, width=SNIPPET_CHARS):
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width) if positions else 0
+    end = min(len(text), start + width * 2 + max((len(t) for t in terms), default=0))
+    excerpt = text[start:end].replace("\n", " ")
+    for term in terms:
+        excerpt = re.sub(re.escape(term), lambda m: f"**{m.group(0)}**", excerpt, flags=re.IGNORECASE)
+    return f"{'…' if start > 0 else ''}{excerpt}{'…' if end < len(text) else ''}"
@@ -0,0 +1,287 @@
+# Write-behind persistence: background batched inserts with a local SQLite spool
+import atexit
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+import pymysql
+import streamlit as st
+
+from inq_db import execute_ops, get_pool
+from inq_metrics import TURN_METRICS_SCHEMA
+from inq_rubric import RUBRIC_SCHEMA
+from inq_schema import NORMALIZED, SCHEMA, storage_layout
+
+WRITE_BATCH_SIZE = 50       # 한 번에 모아 쓰는 최대 건수
+WRITE_RETRIES = 4           # 스풀로 넘기기 전 재시도 횟수
+WRITE_BACKOFF = 0.5         # 재시도 대기 시간(초), 매번 두 배
+REPLAY_INTERVAL = 30        # DB가 다시 살아났는지 스풀 재전송을 시도하는 간격(초)
+STOP_TIMEOUT = 10           # 종료 시 쓰는 중인 배치를 스풀에 넘길 때까지 기다리는 최대 시간(초)
+DEFAULT_SPOOL_PATH = "qna_spool.sqlite3"
+# 연결이 끊기거나 잠금 대기 등 다시 시도하면 될 수 있는 오류 (그 밖의 오류는 같은 쓰기를 반복해도 실패함)
+TRANSIENT_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+# CREATE TABLE을 서버가 받아들이지 않아도(권한 없음 등) 연결 자체는 살아 있는 오류 코드의 상한 (2000번대는 클라이언트 연결 오류)
+SERVER_ERROR_MAX = 1999
+SERVER_BUSY_ERRORS = {1040, 1053, 1205, 1213}  # 연결 수 초과, 서버 종료 중, 잠금 대기 시간 초과, 교착 상태
+
+_CREATE_TABLE_RE = re.compile(r"CREATE TABLE IF NOT EXISTS (\w+)")
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceWriter:
+    """Accepts (sql, params) writes and applies them on a background thread.
+
+    Consecutive writes with the same SQL are batched into one executemany. When MySQL stays
+    unreachable after retries, the batch is appended to a local SQLite spool, which is replayed
+    on startup and periodically afterwards, in the original order. A batch that fails for any
+    other reason is retried one write at a time, and writes that still fail are moved to a
+    dead_letter table in the spool file instead of blocking the ones after them.
+
+    Each CREATE TABLE in schema is run by the writer thread before the first write that names its
+    table, so callers never wait on DDL. When the server rejects one (e.g. no CREATE privilege),
+    only the writes to that table are dead-lettered; writes to other tables, such as qna, go on.
+    """
+
+    def __init__(self, pool, spool_path, schema=()):
+        self.pool = pool
+        self.schema = {_CREATE_TABLE_RE.search(statement).group(1): statement for statement in schema}
+        self._tables_ready = set()
+        self._tables_failed = {}  # table -> 서버가 CREATE TABLE을 거부한 오류
+        self._op_tables = {}      # sql -> 이 쓰기가 사용하는 schema의 테이블
+        self._queue = queue.Queue()
+        self._spool = sqlite3.connect(spool_path, check_same_thread=False, isolation_level=None)
+        self._spool.execute("CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, sql TEXT NOT NULL, params TEXT NOT NULL)")
+        self._spool.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter (id INTEGER PRIMARY KEY AUTOINCREMENT, sql TEXT NOT NULL, params TEXT NOT NULL, "
+            "error TEXT NOT NULL, time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        self._spool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.committed = 0
+        self.spooled = self._spool.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self.dead_letters = self._spool.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+        self._last_replay = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="inq-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    # Queue a write and return immediately
+    def submit(self, sql, params):
+        # 스풀에 JSON으로 저장하므로 파라미터는 JSON으로 표현 가능한 값이어야 함
+        self._queue.put((sql, list(params)))
+
+    # Queue several writes that belong together, keeping their order
+    def submit_many(self, ops):
+        for sql, params in ops:
+            self.submit(sql, params)
+
+    def status(self):
+        with self._stats_lock:
+            return {
+                "pending": self._queue.qsize() + self.in_flight,
+                "spooled": self.spooled,
+                "committed": self.committed,
+                "dead_letters": self.dead_letters,
+                "alive": self._thread.is_alive(),
+            }
+
+    def stop(self):
+        # 프로세스 종료 시 아직 쓰지 못한 작업을 스풀에 남겨 다음 시작 때 재전송
+        # (재시도 대기 중인 배치는 writer 스레드가 대기를 멈추고 스풀에 넘긴 뒤 끝나므로 먼저 기다림)
+        self._stopped.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=STOP_TIMEOUT)
+            if self._thread.is_alive():
+                logger.warning("writer 스레드가 %d초 안에 끝나지 않음, 쓰는 중인 %d건은 남기지 못할 수 있음", STOP_TIMEOUT, self.in_flight)
+        remaining = self._drain(block=False, limit=None)
+        if remaining:
+            self._to_spool(remaining)
+
+    def _drain(self, block, limit):
+        items = []
+        try:
+            if block:
+                items.append(self._queue.get(timeout=1))
+            while limit is None or len(items) < limit:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def _run(self):
+        try:
+            self._replay_spool()
+        except Exception:
+            logger.exception("스풀 재전송 중 예기치 않은 오류")
+        while not self._stopped.is_set():
+            batch = self._drain(block=True, limit=WRITE_BATCH_SIZE)
+            # 어떤 오류가 나도 writer 스레드가 죽지 않도록 함 (DB 오류는 _step 안에서 처리되므로 여기까지 오는 것은 스풀 파일 오류 등)
+            try:
+                self._step(batch)
+            except Exception:
+                logger.exception("DB 쓰기 중 예기치 않은 오류, %d건을 처리하지 못함", len(batch))
+                time.sleep(WRITE_BACKOFF)
+            finally:
+                with self._stats_lock:
+                    self.in_flight = 0
+
+    def _step(self, batch):
+        if self.spooled and time.monotonic() - self._last_replay > REPLAY_INTERVAL:
+            self._replay_spool()
+        if not batch:
+            return
+        with self._stats_lock:
+            self.in_flight = len(batch)
+        if self.spooled:
+            # 앞선 쓰기가 아직 스풀에 있으면 순서가 바뀌지 않도록 그 뒤에 이어 붙임
+            self._to_spool(batch)
+            return
+        remaining = self._write_with_retry(batch)
+        if remaining:
+            self._to_spool(remaining)
+
+    def _tables(self, sql):
+        tables = self._op_tables.get(sql)
+        if tables is None:
+            tables = self._op_tables[sql] = [table for table in self.schema if re.search(rf"\b{table}\b", sql)]
+        return tables
+
+    # Create the tables this batch needs that do not exist yet; a rejected CREATE marks only that table as failed
+    def _prepare_tables(self, batch):
+        needed = {table for sql, _ in batch for table in self._tables(sql)} - self._tables_ready - self._tables_failed.keys()
+        if not needed:
+            return
+        with self.pool.connection() as db:
+            with db.cursor() as cursor:
+                for table in sorted(needed):
+                    try:
+                        cursor.execute(self.schema[table])
+                    except pymysql.MySQLError as e:
+                        code = e.args[0] if e.args and isinstance(e.args[0], int) else None
+                        if isinstance(e, pymysql.err.InterfaceError) or code is None or code > SERVER_ERROR_MAX or code in SERVER_BUSY_ERRORS:
+                            raise
+                        logger.error("%s 테이블을 만들 수 없어 이 테이블에 대한 쓰기는 dead_letter로 옮김: %s", table, e)
+                        self._tables_failed[table] = e
+                        continue
+                    self._tables_ready.add(table)
+
+    def _table_error(self, sql):
+        for table in self._tables(sql):
+            if table in self._tables_failed:
+                return self._tables_failed[table]
+        return None
+
+    def _write(self, batch):
+        with self.pool.connection() as db:
+            # 배치 전체를 한 트랜잭션으로 묶어 재시도 시 일부만 중복 기록되지 않게 함
+            db.begin()
+            with db.cursor() as cursor:
+                execute_ops(cursor, batch)
+            db.commit()
+        with self._stats_lock:
+            self.committed += len(batch)
+
+    # Write a batch; returns the ops left unwritten by a transient error, in order (empty when every op was written or dead-lettered)
+    def _apply(self, batch):
+        try:
+            self._prepare_tables(batch)
+        except TRANSIENT_ERRORS as e:
+            logger.warning("DB 쓰기 실패: %s", e)
+            return batch
+        writable = []
+        for op in batch:
+            error = self._table_error(op[0])
+            if error is None:
+                writable.append(op)
+            else:
+                self._dead_letter(op, error)
+        if not writable:
+            return []
+        try:
+            self._write(writable)
+            return []
+        except TRANSIENT_ERRORS as e:
+            logger.warning("DB 쓰기 실패: %s", e)
+            return writable
+        except Exception as e:
+            logger.warning("배치 쓰기 실패, 한 건씩 다시 씀: %s", e)
+        for i, op in enumerate(writable):
+            try:
+                self._write([op])
+            except TRANSIENT_ERRORS as e:
+                logger.warning("DB 쓰기 실패: %s", e)
+                return writable[i:]
+            except Exception as e:
+                self._dead_letter(op, e)
+        return []
+
+    def _write_with_retry(self, batch):
+        delay = WRITE_BACKOFF
+        for attempt in range(WRITE_RETRIES):
+            batch = self._apply(batch)
+            if not batch:
+                return []
+            logger.warning("DB 쓰기 재시도 (%d/%d), %d건 남음", attempt + 1, WRITE_RETRIES, len(batch))
+            # 종료 중이면 더 기다리지 않고 남은 작업을 스풀로 넘김
+            if attempt + 1 < WRITE_RETRIES:
+                if self._stopped.wait(delay):
+                    break
+                delay *= 2
+        return batch
+
+    def _to_spool(self, batch):
+        with self._spool_lock:
+            self._spool.executemany(
+                "INSERT INTO spool (sql, params) VALUES (?, ?)",
+                [(sql, json.dumps(params, ensure_ascii=False)) for sql, params in batch]
+            )
+        with self._stats_lock:
+            self.spooled += len(batch)
+
+    # Keep a write that can never succeed aside (sqlite3 qna_spool.sqlite3 "SELECT * FROM dead_letter"로 확인)
+    def _dead_letter(self, op, error):
+        sql, params = op
+        logger.error("DB 쓰기를 dead_letter로 옮김: %s", error)
+        with self._spool_lock:
+            self._spool.execute(
+                "INSERT INTO dead_letter (sql, params, error) VALUES (?, ?, ?)",
+                (sql, json.dumps(params, ensure_ascii=False, default=str), f"{type(error).__name__}: {error}")
+            )
+        with self._stats_lock:
+            self.dead_letters += 1
+
+    def _replay_spool(self):
+        self._last_replay = time.monotonic()
+        while True:
+            with self._spool_lock:
+                rows = self._spool.execute("SELECT id, sql, params FROM spool ORDER BY id LIMIT ?", (WRITE_BATCH_SIZE,)).fetchall()
+            if not rows:
+                return
+            batch = [(sql, json.loads(params)) for _, sql, params in rows]
+            remaining = self._apply(batch)
+            # 기록했거나 dead_letter로 옮긴 행만 지움 (남은 행은 원래 순서대로 다음 재전송 때 다시 씀)
+            left = {id(op) for op in remaining}
+            done = [(row[0],) for row, op in zip(rows, batch) if id(op) not in left]
+            if done:
+                with self._spool_lock:
+                    self._spool.executemany("DELETE FROM spool WHERE id = ?", done)
+                with self._stats_lock:
+                    self.spooled -= len(done)
+            if remaining:
+                logger.warning("스풀 재전송 중단, %d건 남음", len(remaining))
+                return
+
+
+@st.cache_resource
+def get_writer():
+    schema = [TURN_METRICS_SCHEMA, *RUBRIC_SCHEMA]
+    if storage_layout() == NORMALIZED:
+        schema = SCHEMA + schema
+    return PersistenceWriter(get_pool(), st.secrets.get("DB_SPOOL_PATH", DEFAULT_SPOOL_PATH), schema)